@@ -18,14 +18,21 @@
 # USA.
 
 
+import atexit
+import collections
+import hashlib
 import logging
 import multiprocessing
+import re
+import weakref
 
 
+import babelfish
 import guessit
 
 
 from arroyo import schema
+from arroyo.services import cache
 
 
 class Tags:
@@ -89,58 +96,585 @@ KNOWN_DISTRIBUTORS = [
 ]  # keep lower case!!
 
 
+# Fast path for the most common scene release layouts:
+#
+#   Series.Name[.Year].S01E02.<tokens>-GROUP[.ext]
+#   Movie.Name.Year.<tokens>-GROUP[.ext]
+#
+# Every token must be known, title words must be plain words and each
+# field can be set only once. Anything else goes to guessit. Values mimic
+# guessit output so both paths are interchangeable.
+FAST_PARSE_TOKENS = {
+    '480p': (('screen_size', '480p'),),
+    '576p': (('screen_size', '576p'),),
+    '720p': (('screen_size', '720p'),),
+    '1080p': (('screen_size', '1080p'),),
+    '2160p': (('screen_size', '2160p'),),
+
+    'hdtv': (('source', 'HDTV'),),
+    'web': (('source', 'Web'),),
+    'web-dl': (('source', 'Web'),),
+    'webrip': (('source', 'Web'), ('other', 'Rip')),
+    'bluray': (('source', 'Blu-ray'),),
+
+    'x264': (('video_codec', 'H.264'),),
+    'h264': (('video_codec', 'H.264'),),
+    'h.264': (('video_codec', 'H.264'),),
+    'x265': (('video_codec', 'H.265'),),
+    'h265': (('video_codec', 'H.265'),),
+    'h.265': (('video_codec', 'H.265'),),
+    'xvid': (('video_codec', 'Xvid'),),
+
+    'aac': (('audio_codec', 'AAC'),),
+    'aac2.0': (('audio_codec', 'AAC'), ('audio_channels', '2.0')),
+    'dd5.1': (('audio_codec', 'Dolby Digital'), ('audio_channels', '5.1')),
+    'ddp2.0': (('audio_codec', 'Dolby Digital Plus'),
+               ('audio_channels', '2.0')),
+    'ddp5.1': (('audio_codec', 'Dolby Digital Plus'),
+               ('audio_channels', '5.1')),
+
+    'amzn': (('streaming_service', 'Amazon Prime'),),
+    'dsnp': (('streaming_service', 'Disney+'),),
+    'hmax': (('streaming_service', 'HBO Max'),),
+    'hulu': (('streaming_service', 'Hulu'),),
+
+    'proper': (('other', 'Proper'), ('proper_count', 1)),
+    'repack': (('other', 'Proper'), ('proper_count', 1)),
+}
+
+FAST_PARSE_CONTAINERS = {
+    'avi': 'video/x-msvideo',
+    'mkv': 'video/x-matroska',
+    'mp4': 'video/mp4',
+}
+
+# Words guessit may interpret as something else than title (languages,
+# countries, editions, formats...). Completed with guessit and babelfish
+# vocabularies below. Short words are too ambiguous, only those in
+# FAST_PARSE_SHORT_WORDS are allowed.
+FAST_PARSE_UNSAFE_WORDS = {
+    'aac', 'ac3', 'alternative', 'atmos', 'audio', 'australia', 'avc', 'avi',
+    'bdrip', 'bonus', 'brazilian', 'cam', 'castellano', 'cd', 'chapter',
+    'collector', 'complete', 'criterion', 'cut', 'cze', 'czech', 'deluxe',
+    'deu', 'directors', 'dirfix', 'disc', 'divx', 'dolby', 'dsr', 'dts',
+    'dual', 'dub', 'dubbed', 'dut', 'dutch', 'dvb', 'dvd', 'dvdrip',
+    'edition', 'eng', 'english', 'ep', 'episode', 'eps', 'esp', 'extended',
+    'extras', 'festival', 'final', 'fix', 'flac', 'fra', 'fre', 'french',
+    'ger', 'german', 'hardsub', 'hdcam', 'hdrip', 'hdtv', 'heb', 'hebrew',
+    'hevc', 'hin', 'hindi', 'hun', 'hungarian', 'hybrid', 'imax', 'integrale',
+    'internal', 'ita', 'italian', 'japanese', 'jpn', 'kor', 'korean',
+    'limited', 'minisode', 'mkv', 'mono', 'mp3', 'mp4', 'multi', 'multisub',
+    'nor', 'norwegian', 'ntsc', 'oav', 'ona', 'ova', 'pal', 'part', 'pdtv',
+    'pilot', 'pol', 'polish', 'portuguese', 'ppv', 'preair', 'proper', 'real',
+    'remastered', 'remux', 'repack', 'rerip', 'restored', 'retail', 'rip',
+    'rus', 'russian', 'saison', 'sample', 'screener', 'sdtv', 'season',
+    'secam', 'spa', 'spanish', 'special', 'specials', 'stereo', 'subbed',
+    'subita', 'subs', 'swe', 'swedish', 'telesync', 'theatrical', 'trailer',
+    'truefrench', 'uhd', 'uncensored', 'uncut', 'version', 'vhs', 'vol',
+    'volume', 'vorbis', 'vost', 'web', 'webcap', 'webrip', 'workprint', 'xvid',
+}
+
+FAST_PARSE_SHORT_WORDS = {
+    'mr', 'ms', 'dr', 'st', 'jr', 'sr', 'vs', 'an', 'at', 'be', 'by', 'do',
+    'go', 'he', 'if', 'in', 'is', 'it', 'me', 'my', 'no', 'of', 'on', 'or',
+    'so', 'to', 'up', 'we',
+}
+
+
+# guessit config sections with words that never belong to a title
+_FAST_PARSE_GUESSIT_SECTIONS = (
+    'audio_codec', 'container', 'country', 'edition', 'language', 'other',
+    'source', 'streaming_service',
+)
+
+
+def _guessit_words(config):
+    """
+    Collect plain words matched by guessit config.
+
+    Regexes and rule options are skipped, they match in context.
+    """
+    if isinstance(config, str):
+        if re.match(r'^[A-Za-z]+$', config):
+            yield config.lower()
+
+    elif isinstance(config, dict):
+        for (key, value) in config.items():
+            if key not in ('regex', 'tags', 'conflict_solver', 'validator'):
+                yield from _guessit_words(value)
+
+    elif isinstance(config, list):
+        for value in config:
+            yield from _guessit_words(value)
+
+
+def _fast_parse_unsafe_words():
+    config = guessit.options.load_config({})
+    advanced = config['advanced_config']
+
+    words = set()
+    for section in _FAST_PARSE_GUESSIT_SECTIONS:
+        words.update(_guessit_words(advanced.get(section)))
+
+    # Any language name (guessit uses babelfish) and the codes of the
+    # languages and countries guessit looks for
+    for lang in babelfish.LANGUAGE_MATRIX:
+        if re.match(r'^[A-Za-z]+$', lang.name):
+            words.add(lang.name.lower())
+
+    for code in config.get('allowed_languages', []):
+        try:
+            lang = babelfish.Language.fromietf(code)
+        except ValueError:
+            continue
+
+        words.add(lang.alpha3)
+        words.update(_guessit_words(lang.name))
+
+    for code in config.get('allowed_countries', []):
+        country = babelfish.Country(code.upper())
+        words.add(code.lower())
+        words.update(_guessit_words(country.name))
+
+    words.update(token for token in FAST_PARSE_TOKENS
+                 if re.match(r'^[a-z]+$', token))
+    words.update(FAST_PARSE_CONTAINERS)
+
+    # guessit keeps these in titles
+    words.difference_update(_guessit_words(advanced.get('title')))
+    words.difference_update(_guessit_words(advanced.get('common_words')))
+
+    return words
+
+
+FAST_PARSE_UNSAFE_WORDS.update(_fast_parse_unsafe_words())
+
+_fast_parse_re = re.compile(
+    r'^(?P<title>[^\s.]+(?:[\s.][^\s.]+)*?)'
+    r'(?:'
+    r'(?:[\s.](?P<year>(?:19|20)\d\d))?'
+    r'[\s.][Ss](?P<season>\d{1,2})[Ee](?P<episode>\d{1,3})'
+    r'|'
+    r'[\s.](?P<movie_year>(?:19|20)\d\d)'
+    r')'
+    r'(?P<sep>[\s.])(?P<tokens>.+?)'
+    r'-(?P<group>[A-Za-z0-9]+)'
+    r'(?:\.(?P<container>' + '|'.join(FAST_PARSE_CONTAINERS) + r'))?$')
+
+_fast_parse_token_re = re.compile(
+    r'(?:aac2\.0|dd5\.1|ddp[25]\.[01]|h\.26[45]|[^.]+)', re.IGNORECASE)
+
+_fast_parse_word_re = re.compile(r'^[A-Za-z][a-z]*$')
+
+
+class ParseCache:
+    """
+    Cache for guessit results.
+
+    Results are kept in a in-memory LRU of `maxsize` items, backed by an
+    optional persistent cache (any arroyo.services.cache object). Keys
+    include guessit version so results are invalidated on upgrades.
+    """
+    def __init__(self, maxsize=10000, persistent=None):
+        self.maxsize = maxsize
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self._lru = collections.OrderedDict()
+
+    @staticmethod
+    def key(name, type_hint=None):
+        return '\0'.join([guessit.__version__, type_hint or '', name])
+
+    def get(self, name, type_hint=None):
+        key = self.key(name, type_hint)
+
+        try:
+            value = self._lru[key]
+            self._lru.move_to_end(key)
+
+        except KeyError:
+            value = None
+
+        if value is None and self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+                self._remember(key, value)
+            except cache.CacheKeyError:
+                pass
+
+        if value is None:
+            self.misses += 1
+            raise cache.CacheKeyMissError(key)
+
+        self.hits += 1
+        # Callers are free to modify the returned value
+        return dict(value)
+
+    def set(self, name, type_hint, value):
+        key = self.key(name, type_hint)
+        value = dict(value)
+
+        self._remember(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def clear(self):
+        self._lru.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._lru)
+        }
+
+
+parse_cache = ParseCache()
+
+
+# Version of analysis results kept in Analyzer.store. Bump it when the
+# entities or metadata built from a name change.
+STORE_VERSION = '1'
+
+
+class Analyzer:
+    """
+    Analyzes sources using a long-lived pool of worker processes.
+
+    The pool is created on first use and reused between calls so forking,
+    importing and warming up guessit is paid only once. Batches smaller
+    than `min_batch` are analyzed in the current process since the IPC
+    overhead is bigger than the gain.
+
+    Fast path and parse_cache lookups are done in the current process, only
+    names missing from the cache are sent to the workers, which just run
+    guessit. Their results are saved into parse_cache.
+
+    If `store` (any arroyo.services.cache object) is given, analysis results
+    are saved there by source id and sources already analyzed are not parsed
+    again. Stored results are tied to STORE_VERSION, guessit version and
+    the current distributors.
+    """
+    MIN_BATCH = 8
+
+    def __init__(self, processes=None, min_batch=MIN_BATCH, store=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.min_batch = min_batch
+        self.store = store
+        self._pool = None
+
+        _analyzers.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = _mp_context().Pool(
+                self.processes, initializer=_init_worker)
+
+        return self._pool
+
+    def close(self):
+        if self._pool is None:
+            return
+
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def chunksize(self, n):
+        # Same heuristic as Pool.map: ~4 chunks per worker
+        chunksize, extra = divmod(n, self.processes * 4)
+        return chunksize + 1 if extra else chunksize
+
+    def _parse_iter(self, keys, mp):
+        """
+        Yield (key, parsed) pairs for each (name, type hint) key, in no
+        particular order. parsed is None for names that can't be analyzed.
+        """
+        misses = collections.OrderedDict()
+
+        for key in keys:
+            (name, type_hint) = key
+            stripped, distributors = strip_distributors(name)
+
+            guess = fast_parse(stripped)
+            if guess is None:
+                try:
+                    guess = parse_cache.get(stripped, type_hint)
+                except cache.CacheKeyMissError:
+                    misses.setdefault((stripped, type_hint), []).append(
+                        (key, distributors))
+                    continue
+
+            yield _safe_normalize(key, stripped, type_hint, guess,
+                                  distributors)
+
+        # Different names may have the same guessit input (i.e. when
+        # distributors are stripped), run guessit only once for them.
+        jobs = list(misses)
+        if mp and len(jobs) >= self.min_batch:
+            results = self.pool.imap_unordered(
+                _guessit_job, jobs, chunksize=self.chunksize(len(jobs)))
+        else:
+            results = map(_guessit_job, jobs)
+
+        for (job, guess) in results:
+            (stripped, type_hint) = job
+
+            if guess is None:
+                logmsg = "Error analyzing '%s'"
+                logmsg = logmsg % stripped
+                _logger.warning(logmsg)
+
+            else:
+                parse_cache.set(stripped, type_hint, guess)
+
+            for (key, distributors) in misses[job]:
+                if guess is None:
+                    yield (key, None)
+                else:
+                    yield _safe_normalize(key, stripped, type_hint,
+                                          dict(guess), distributors)
+
+    def _lookup(self, sources):
+        if self.store is None:
+            return {}
+
+        return self.store.get_many([_store_key(src) for src in sources])
+
+    def _save(self, sources, parsed):
+        if self.store is None:
+            return
+
+        for src in sources:
+            srcparsed = parsed.get(_parse_key(src))
+            if srcparsed is not None:
+                entity, metadata, _ = srcparsed
+                self.store.set(_store_key(src), (entity, metadata))
+
+    def analyze_iter(self, *sources, mp=True):
+        """
+        Yield analyzed sources as soon as they are ready, not necessarily in
+        the same order. Sources that can't be analyzed are skipped.
+
+        Sources sharing name and type hint are parsed only once.
+        """
+        known = self._lookup(sources)
+
+        groups = collections.OrderedDict()
+        for src in sources:
+            stored = known.get(_store_key(src))
+            if stored is not None:
+                yield _apply_parsed(src, stored + (None,))
+            else:
+                groups.setdefault(_parse_key(src), []).append(src)
+
+        for (key, parsed) in self._parse_iter(list(groups), mp):
+            if parsed is None:
+                continue
+
+            self._save(groups[key], {key: parsed})
+            for src in groups[key]:
+                yield _apply_parsed(src, parsed)
+
+    def analyze(self, *sources, mp=True):
+        known = self._lookup(sources)
+        pending = [src for src in sources if _store_key(src) not in known]
+
+        keys = list(collections.OrderedDict.fromkeys(
+            _parse_key(src) for src in pending))
+        parsed = dict(self._parse_iter(keys, mp))
+        self._save(pending, parsed)
+
+        ret = []
+        for src in sources:
+            stored = known.get(_store_key(src))
+            if stored is not None:
+                srcparsed = stored + (None,)
+            else:
+                srcparsed = parsed[_parse_key(src)]
+
+            if srcparsed is not None:
+                ret.append(_apply_parsed(src, srcparsed))
+
+        return ret
+
+
+# Live analyzers, their pools are closed at exit
+_analyzers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_analyzers():
+    for analyzer in list(_analyzers):
+        analyzer.close()
+
+
+_analyzer = None
+
+
+def _default_analyzer():
+    global _analyzer
+
+    if _analyzer is None:
+        _analyzer = Analyzer()
+
+    return _analyzer
+
+
+def _mp_context():
+    # The pool may be started while other threads are alive (the scraper
+    # runs its event loop in a background thread), forking then can leave
+    # locks held in the workers. Fork them from a clean server process
+    # instead, with arroyo.analyze (and guessit) already imported.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+
+    return multiprocessing.get_context('spawn')
+
+
+def _init_worker():
+    # First guessit call builds rebulk rules, do it before any real work
+    try:
+        guessit.guessit('Warmup.S01E01.720p.HDTV.x264-GROUP')
+    except guessit.api.GuessitException:
+        pass
+
+
 def analyze(*sources, mp=True):
-    if mp:
-        with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
-            ret = pool.map(_safe_analyze_one, sources)
-    else:
-        ret = list(map(_safe_analyze_one, sources))
+    return _default_analyzer().analyze(*sources, mp=mp)
+
+
+def _parse_key(source):
+    return (source.name, source.hints.get('type'))
 
-    ret = list(filter(lambda x: x is not None, ret))
-    return ret
 
+def _store_key(source):
+    # Source ids are infohashes, a given id always has the same name
+    return '\0'.join([STORE_VERSION, guessit.__version__,
+                      _distributors_version, source.id,
+                      source.hints.get('type') or ''])
 
-def _safe_analyze_one(source, type_hint=None):
+
+def _guessit_job(job):
+    # Runs on pool workers, they don't use parse_cache
+    name, type_hint = job
+
+    try:
+        return job, _run_guessit(name, type_hint)
+    except ParseError:
+        return job, None
+
+
+def _safe_normalize(key, name, type_hint, parsed, release_distributors):
     try:
-        return analyze_one(source, type_hint)
+        return key, normalize(name, type_hint, parsed, release_distributors)
     except NormalizationError:
         logmsg = "Error analyzing '%s'"
-        logmsg = logmsg % source.name
+        logmsg = logmsg % name
         _logger.warning(logmsg)
+        return key, None
 
 
-def analyze_one(source, type_hint=None):
-    type_hint = type_hint or source.hints.get('type')
+def _apply_parsed(source, parsed):
+    entity, metadata, _ = parsed
 
-    entity, metadata, other = parse(source.name, type_hint)
-    params = source.dict()
-    params.update({
+    # Source is already validated, there is no need to rebuild it. Entities
+    # are shared between sources with the same name
+    return source.copy(update={
         'entity': entity,
-        'metadata': metadata,
-        'other': other
+        'metadata': dict(metadata)
     })
 
-    return schema.Source(**params)
 
+def analyze_one(source, type_hint=None):
+    type_hint = type_hint or source.hints.get('type')
+    return _apply_parsed(source, parse(source.name, type_hint))
 
-def parse(name, type_hint=None):
+
+def build_distributors_re(distributors):
+    # Longest first so tags sharing a prefix are matched properly
+    distributors = sorted(set(x.lower() for x in distributors),
+                          key=lambda x: (-len(x), x))
+    return re.compile(
+        r'\[(' + '|'.join(re.escape(x) for x in distributors) + r')\]',
+        re.IGNORECASE)
+
+
+def build_distributors_version(distributors):
+    distributors = sorted(set(x.lower() for x in distributors))
+    data = '\0'.join(distributors).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()[:8]
+
+
+def set_distributors(distributors):
+    """
+    Replace the distributor tags stripped from names before parsing.
+    """
+    global _distributors, _distributors_re, _distributors_version
+
+    _distributors = list(distributors)
+    _distributors_re = build_distributors_re(_distributors)
+    _distributors_version = build_distributors_version(_distributors)
+
+
+def get_distributors():
+    return list(_distributors)
+
+
+def strip_distributors(name):
     # We preprocess name to extract distributors
     # (distributors != release-teams)
+    if '[' not in name:
+        return name, set()
+
     release_distributors = set()
-    for dist in KNOWN_DISTRIBUTORS:
-        tag = '[' + dist + ']'
-        idx = name.lower().find(tag)
-        if idx == -1:
-            continue
 
-        name = (name[:idx] + name[idx+len(tag):]).strip()
-        release_distributors.add(dist)
+    def _extract(m):
+        release_distributors.add(m.group(1).lower())
+        return ''
 
-    try:
-        parsed = guessit.guessit(name, options={type: type_hint})
-    except guessit.api.GuessitException as e:
-        raise ParseError() from e
+    name = _distributors_re.sub(_extract, name).strip()
+    return name, release_distributors
+
+
+_distributors = list(KNOWN_DISTRIBUTORS)
+_distributors_re = build_distributors_re(_distributors)
+_distributors_version = build_distributors_version(_distributors)
+
+
+def parse(name, type_hint=None):
+    name, release_distributors = strip_distributors(name)
+
+    parsed = fast_parse(name)
+    if parsed is None:
+        parsed = _guessit(name, type_hint)
+
+    return normalize(name, type_hint, parsed, release_distributors)
 
+
+def normalize(name, type_hint, parsed, release_distributors=None):
+    """
+    Build the (entity, metadata, parsed) tuple returned by parse from
+    guessit-like data. parsed is modified.
+    """
     # Fixes: Insert distributors again
     if release_distributors:
         parsed['release_distributors'] = list(release_distributors)
@@ -213,6 +747,95 @@ def parse(name, type_hint=None):
     #             del info['language']
 
 
+def fast_parse(name):
+    """
+    Parse common scene release names without guessit.
+
+    Returns a guessit-like dict or None if name doesn't follow the supported
+    layouts exactly.
+    """
+    m = _fast_parse_re.match(name)
+    if not m:
+        return None
+
+    sep = m.group('sep')
+    title = m.group('title')
+    tokens = m.group('tokens')
+
+    # Separators must be consistent
+    if sep == '.':
+        if ' ' in name:
+            return None
+        tokens = _fast_parse_token_re.findall(tokens)
+
+    else:
+        if '.' in title:
+            return None
+        tokens = tokens.split(' ')
+
+    words = title.split(sep)
+    for word in words:
+        lower = word.lower()
+        if (not _fast_parse_word_re.match(word) or
+                lower in FAST_PARSE_UNSAFE_WORDS or
+                (len(lower) <= 2 and lower not in FAST_PARSE_SHORT_WORDS)):
+            return None
+
+    parsed = {'title': ' '.join(words)}
+
+    year = m.group('year') or m.group('movie_year')
+    if year:
+        parsed['year'] = int(year)
+
+    if m.group('season'):
+        parsed['season'] = int(m.group('season'))
+        parsed['episode'] = int(m.group('episode'))
+
+    for token in tokens:
+        fields = FAST_PARSE_TOKENS.get(token.lower())
+        if fields is None:
+            return None
+
+        for (k, v) in fields:
+            if k in parsed:
+                return None
+
+            parsed[k] = v
+
+    parsed['release_group'] = m.group('group')
+
+    container = m.group('container')
+    if container:
+        parsed['container'] = container
+        parsed['mimetype'] = FAST_PARSE_CONTAINERS[container]
+
+    parsed['type'] = 'episode' if m.group('season') else 'movie'
+
+    return parsed
+
+
+def _guessit(name, type_hint=None):
+    try:
+        return parse_cache.get(name, type_hint)
+
+    except cache.CacheKeyMissError:
+        pass
+
+    parsed = _run_guessit(name, type_hint)
+    parse_cache.set(name, type_hint, parsed)
+
+    return parsed
+
+
+def _run_guessit(name, type_hint=None):
+    try:
+        parsed = guessit.guessit(name, options={type: type_hint})
+    except guessit.api.GuessitException as e:
+        raise ParseError() from e
+
+    return dict(parsed)
+
+
 def extract_entity(info, type=None):
     type_candidates = [type, info.get('type')]
     type_candidates = [x for x in type_candidates if x]
@@ -68,6 +68,12 @@ class App:
         network_cache_path = appdirs.user_cache_dir() + '/arroyo/network'
         os.makedirs(network_cache_path, exist_ok=True)
 
+        analyze_cache_path = appdirs.user_cache_dir() + '/arroyo/analyze'
+        os.makedirs(analyze_cache_path, exist_ok=True)
+
+        sources_cache_path = appdirs.user_cache_dir() + '/arroyo/sources'
+        os.makedirs(sources_cache_path, exist_ok=True)
+
         # Setup core
         self.srvs = Services(
             logger=logger,
@@ -82,9 +88,41 @@ class App:
                 basedir=network_cache_path,
                 delta=self.srvs.settings.get('cache.delta')
             )
+            # Parse results only depend on name and guessit version (which
+            # is part of the key), they expire just to bound disk usage.
+            # Entries for names not seen anymore are never overwritten, purge
+            # them.
+            analyze.parse_cache.persistent = cache.DiskCache(
+                basedir=analyze_cache_path,
+                delta=self.srvs.settings.get(
+                    defaults.KEY_ANALYZE_CACHE_DELTA)
+            )
+            analyze.parse_cache.persistent.purge()
+
+        extra_distributors = self.srvs.settings.get(
+            defaults.KEY_ANALYZE_EXTRA_DISTRIBUTORS)
+        if isinstance(extra_distributors, str):
+            extra_distributors = extra_distributors.split(',')
+        # Tags can be given with or without brackets ("foo" or "[foo]")
+        extra_distributors = [x.strip().strip('[]').strip()
+                              for x in extra_distributors]
+        extra_distributors = [x for x in extra_distributors if x]
+        if extra_distributors:
+            analyze.set_distributors(
+                analyze.KNOWN_DISTRIBUTORS + extra_distributors)
 
         # Setup engines
         self.scraper = scraper.Engine(self.srvs)
+        self.analyzer = analyze.Analyzer(processes=int(
+            self.srvs.settings.get(defaults.KEY_ANALYZE_WORKERS)))
+        if self.srvs.settings.get('cache.enabled'):
+            self.analyzer.store = cache.DiskCache(
+                basedir=sources_cache_path,
+                delta=self.srvs.settings.get(
+                    defaults.KEY_ANALYZE_CACHE_DELTA)
+            )
+            self.analyzer.store.purge()
+
         self.filters = query.Engine(self.srvs)
         self.downloads = downloads.Downloads(self.srvs)
 
@@ -98,21 +136,31 @@ class App:
         else:
             scrapectxs = self.scraper.build_contexts_for_query(q)
 
-        results = self.scraper.process(*scrapectxs)
-        results = analyze.analyze(*results, mp=False)
+        # Analyze and filter each batch of sources as soon as it's scraped
+        found = 0
+        results = []
+        for sources in self.scraper.process_iter(*scrapectxs):
+            sources = list(self.analyzer.analyze_iter(*sources))
+            found += len(sources)
+            if not sources:
+                continue
+
+            results.extend(self.filters.apply(filterctx, sources))
+
+        logmsg = "Parse cache: %(hits)s hits, %(misses)s misses"
+        logmsg = logmsg % analyze.parse_cache.stats()
+        self.srvs.logger.debug(logmsg)
 
-        if not results:
+        if not found:
             msg = "No results found for %r"
             msg = msg % q
             print(msg)
             return
 
         msg = "Found %s sources"
-        msg = msg % (len(results),)
+        msg = msg % (found,)
         print(msg)
 
-        # Filter results
-        results = self.filters.apply(filterctx, results)
         msg = "Got %s matching sources for %r"
         msg = msg % (len(results), q)
         print(msg)
@@ -183,7 +231,7 @@ class LogFormatter(logging.Formatter):
 class Settings(settings.Settings):
     def get(self, key, default=settings.UNDEF):
         if default == settings.UNDEF:
-            default = defaults.SETTINGS.get(key) or settings.UNDEF
+            default = defaults.SETTINGS.get(key, settings.UNDEF)
 
         ret = super().get(key, default=default)
         return ret
@@ -31,7 +31,17 @@ DEFAULT_LOGLEVEL = 2
 LOG_FORMAT = "[%(levelname)s] [%(name)s] %(message)s"
 
 
+KEY_ANALYZE_CACHE_DELTA = 'analyze.cache-delta'
+KEY_ANALYZE_EXTRA_DISTRIBUTORS = 'analyze.extra-distributors'
+KEY_ANALYZE_WORKERS = 'analyze.workers'
+KEY_SCRAPER_BREAKER_COOLDOWN = 'fetch.breaker-cooldown'
+KEY_SCRAPER_BREAKER_THRESHOLD = 'fetch.breaker-threshold'
+KEY_SCRAPER_KEEPALIVE_TIMEOUT = 'fetch.keepalive-timeout'
 KEY_SCRAPER_MAX_PARALEL_REQUESTS = 'fetch.max-paralel-requests'
+KEY_SCRAPER_PARSE_WORKERS = 'parse.workers'
+KEY_SCRAPER_HTML_BACKEND = 'parse.html-backend'
+KEY_SCRAPER_RETRIES = 'fetch.retries'
+KEY_SCRAPER_RETRY_BACKOFF = 'fetch.retry-backoff'
 KEY_SCRAPER_TIMEOUT = 'fetch.timeout'
 KEY_SCRAPER_UA = 'fetch.user-agent'
 
@@ -43,10 +53,25 @@ SETTINGS = {
     'cache.enabled': True,
     'cache.delta': 60*60,
 
+    # 0 means one worker per CPU
+    KEY_ANALYZE_WORKERS: 0,
+    # Parse results and analyzed sources are kept on disk for 30 days
+    KEY_ANALYZE_CACHE_DELTA: 30*24*60*60,
+    # Comma separated list of distributor tags to strip from names, "foo"
+    # strips "[foo]"
+    KEY_ANALYZE_EXTRA_DISTRIBUTORS: '',
+
     KEY_SCRAPER_UA: ('Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:69.0) '
                      'Gecko/20100101 Firefox/69.0'),
     KEY_SCRAPER_TIMEOUT: 15,
-    KEY_SCRAPER_MAX_PARALEL_REQUESTS: 5,
+    KEY_SCRAPER_MAX_PARALEL_REQUESTS: 10,
+    KEY_SCRAPER_KEEPALIVE_TIMEOUT: 30,
+    KEY_SCRAPER_RETRIES: 2,
+    KEY_SCRAPER_RETRY_BACKOFF: 0.5,
+    KEY_SCRAPER_BREAKER_THRESHOLD: 5,
+    KEY_SCRAPER_BREAKER_COOLDOWN: 5*60,
+    KEY_SCRAPER_PARSE_WORKERS: 0,
+    KEY_SCRAPER_HTML_BACKEND: 'html.parser',
 
     'plugin.transmission.host': 'localhost',
     'plugin.transmission.port': '9091',
@@ -54,7 +54,8 @@ class Downloads:
     @property
     def downloader(self):
         name = self.srvs.settings.get('downloader')
-        return self.srvs.loader.get('downloaders.' + name, self.srvs)
+        return self.srvs.loader.get_instance('downloaders.' + name,
+                                             self.srvs)
 
     def add(self, src):
         try:
@@ -27,7 +27,25 @@ import typing
 import bs4
 
 
-from arroyo import schema
+try:
+    import lxml.html
+    _has_lxml = True
+except ImportError:
+    _has_lxml = False
+
+
+from arroyo import (
+    defaults,
+    schema
+)
+
+
+# Supported values for the parse.html-backend setting:
+# - html.parser: bs4 with python's builtin parser
+# - lxml: bs4 with lxml parser
+# - lxml-tree: plain lxml tree, for providers implementing parse_tree. bs4 is
+#   used with lxml parser for the rest.
+HTML_BACKENDS = ('html.parser', 'lxml', 'lxml-tree')
 
 
 class Extension:
@@ -54,11 +72,36 @@ class CommandUsageError(ExtensionError):
     pass
 
 
+class Response(typing.NamedTuple):
+    status: int
+    headers: typing.Mapping[str, str]
+    text: str
+
+
+class IndexLookup(typing.NamedTuple):
+    # Index name, getter must always return the same values for it
+    field: str
+    # Function of the item, returning the indexed value (None: not indexed)
+    getter: typing.Callable[[typing.Any], typing.Any]
+    # One of 'eq', 'in', 'min' or 'max'
+    op: str
+    value: typing.Any
+    # Lookup matches exactly the items accepted by the filter, there is no
+    # need to apply the filter over candidates
+    exact: bool = True
+
+
 class Provider(Extension):
     DEFAULT_URI: str
     URI_GLOBS: typing.List[str] = []
     URI_REGEXPS: typing.List[str] = []
 
+    # Politeness limits, enforced by the scraper for each host.
+    # RATE_LIMIT is in requests per second, None means unlimited.
+    RATE_LIMIT: typing.Optional[float] = None
+    RATE_BURST: int = 1
+    MAX_IN_FLIGHT: typing.Optional[int] = None
+
     @classmethod
     def can_handle(cls, url):
         for glob in cls.URI_GLOBS:
@@ -74,15 +117,53 @@ class Provider(Extension):
     def paginate(self, url):
         yield url
 
-    async def fetch(self, sess, uri):
-        async with sess.get(uri) as resp:
-            return await resp.text()
+    async def prepare_fetch(self, sess, uri, throttle):
+        """
+        Do any request needed before fetching uri (i.e. auth tokens).
+
+        The scraper calls it inside the same host slot as fetch. Providers
+        must await throttle() before sending each request so they count
+        against the host rate limit.
+        """
+        pass
+
+    async def fetch(self, sess, uri, headers=None):
+        async with sess.get(uri, headers=headers) as resp:
+            # Not modified responses don't have body
+            if resp.status == 304:
+                text = ''
+            else:
+                text = await resp.text()
+
+            return Response(status=resp.status, headers=resp.headers,
+                            text=text)
 
     def parse(self, buffer):
         return []
 
+    @property
+    def html_backend(self):
+        backend = self.srvs.settings.get(defaults.KEY_SCRAPER_HTML_BACKEND,
+                                         'html.parser')
+        if backend not in HTML_BACKENDS:
+            logmsg = "Invalid value for '%s': %s, using html.parser"
+            logmsg = logmsg % (defaults.KEY_SCRAPER_HTML_BACKEND, backend)
+            self.srvs.logger.error(logmsg)
+            return 'html.parser'
+
+        if backend != 'html.parser' and not _has_lxml:
+            return 'html.parser'
+
+        return backend
+
     def parse_as_soup(self, buffer):
-        return bs4.BeautifulSoup(buffer, "html.parser")
+        if self.html_backend == 'html.parser':
+            return bs4.BeautifulSoup(buffer, "html.parser")
+
+        return bs4.BeautifulSoup(buffer, "lxml")
+
+    def parse_as_tree(self, buffer):
+        return lxml.html.fromstring(buffer)
 
     def get_query_uri(self, query):
         return None
@@ -90,6 +171,9 @@ class Provider(Extension):
 
 class Filter(Extension):
     HANDLES: typing.List[str] = []
+    # Relative cost of evaluating the filter on one item, used to order
+    # filters. Simple attribute comparisons cost 1.
+    COST = 1
 
     @classmethod
     def can_handle(cls, key):
@@ -99,9 +183,36 @@ class Filter(Extension):
     def filter(self, key, value, item):
         raise NotImplementedError()
 
+    def cost(self, key):
+        return self.COST
+
+    def compile(self, key, value):
+        """
+        Returns a predicate (a callable accepting an item) equivalent to
+        filter(key, value, item).
+
+        Plugins should override it to do any work not depending on the item
+        (name parsing, value conversion...) only once.
+        """
+        def _filter(item):
+            return self.filter(key, value, item)
+
+        return _filter
+
+    def index(self, key, value):
+        """
+        Returns an IndexLookup to narrow the candidates for
+        filter(key, value) using collection indexes (see
+        query.CollectionIndex) or None if indexes can't be used.
+
+        Lookups must not leave out items accepted by the filter. If the
+        lookup is not exact, candidates are filtered as usual.
+        """
+        return None
+
     def apply(self, key, value, collection):
-        return list([item for item in collection
-                     if self.filter(key, value, item)])
+        pred = self.compile(key, value)
+        return [item for item in collection if pred(item)]
 
 
 class Sorter(Extension):
@@ -24,7 +24,6 @@ import sys
 
 
 from arroyo import (
-    analyze,
     extensions,
     downloads,
     query,
@@ -90,6 +89,15 @@ class Command(extensions.Command):
             '--iterations',
             default=1,
             type=int)
+        scrape_cmd.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Stop at the first page without new sources')
+        scrape_cmd.add_argument(
+            '--watermark',
+            action='store_true',
+            help=('Consider sources older than the newest one seen as '
+                  'already seen (implies --incremental)'))
         scrape_cmd.add_argument(
             '--output',
             type=argparse.FileType('w'),
@@ -131,6 +139,10 @@ class Command(extensions.Command):
             dest='queryparams',
             action='append',
             default=[])
+        query_cmd.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print filter execution order and counters to stderr')
         query_cmd.add_argument(
             dest='querystring',
             nargs='?')
@@ -223,12 +235,21 @@ class Command(extensions.Command):
             raise extensions.CommandUsageError()
 
         engine = scraper.Engine(app.srvs)
-        ctxs = engine.build_n_contexts(args.iterations,
-                                       args.provider,
-                                       args.uri,
-                                       type=args.type,
-                                       language=args.language)
-        results = engine.process(*ctxs)
+        if args.incremental or args.watermark:
+            results = engine.process_incremental(args.iterations,
+                                                 args.provider,
+                                                 args.uri,
+                                                 type=args.type,
+                                                 language=args.language,
+                                                 watermark=args.watermark)
+
+        else:
+            ctxs = engine.build_n_contexts(args.iterations,
+                                           args.provider,
+                                           args.uri,
+                                           type=args.type,
+                                           language=args.language)
+            results = engine.process(*ctxs)
 
         output = json.dumps([x.dict() for x in results], indent=2)
         args.output.write(output)
@@ -239,14 +260,14 @@ class Command(extensions.Command):
             raw = [raw]
 
         raw = [schema.Source(**x) for x in raw]
-        proc = analyze.analyze(*raw, mp=False)
+        proc = app.analyzer.analyze(*raw)
 
         output = json.dumps([x.dict() for x in proc],
                             indent=2,
                             default=_json_encode_hook)
         args.output.write(output)
 
-    def do_query(self, app, args):
+    def run_query(self, app, args):
         def _parse_queryparams(pairs):
             for pair in pairs:
                 key, value = pair.split('=', 1)
@@ -268,9 +289,9 @@ class Command(extensions.Command):
             params = dict(_parse_queryparams(args.queryparams))
             q = query.Query(**params)
 
-        engine = query.Engine()
+        engine = app.filters
         try:
-            ctx = engine.build_filter(q)
+            ctx = engine.build_filter_context(q)
         except query.MissingFiltersError as e:
             errmsg = "Unknow filters: %s"
             errmsg = errmsg % ', '.join(e.args[0])
@@ -282,6 +303,9 @@ class Command(extensions.Command):
         results = engine.apply(ctx, data)
         results = engine.sort(results)
 
+        if args.explain:
+            print(engine.explain(ctx), file=sys.stderr)
+
         results = [[entity.dict(), [src.dict() for src in sources]]
                    for (entity, sources) in results]
         output = json.dumps(results, indent=2,
@@ -324,7 +348,7 @@ class Command(extensions.Command):
         scrape_engine = scraper.Engine()
         ctxs = scrape_engine.build_contexts_for_query(q)
         sources = scrape_engine.process(*ctxs)
-        sources = analyze.analyze(*sources)
+        sources = app.analyzer.analyze(*sources)
 
         # Pass sources thru filters
         results = query_engine.apply(filters, sources)
@@ -73,43 +73,47 @@ class Search(extensions.Command):
         else:
             raise NotImplementedError()
 
-        for q in qs:
-            try:
-                results = app.query(q, provider=args.provider, uri=args.uri)
-            except query.MissingFiltersError as e:
-                msg = "Unknow filters: %s"
-                msg = msg % ', '.join(e.args[0])
-                print(msg, file=sys.stderr)
-                continue
-
-            if not results:
-                print("No results", file=sys.stderr)
-                continue
-
-            labels = [' ', ' ', 'state', 'name', 'size', 's/l']
-            columns = ['selected', 'count', 'state', 'name', 'size', 'share']
-
-            for (entity, sources) in results:
-                data = uilib.build_dataset(self.srvs.db, columns, sources)
-                uilib.display_data(data, labels)
-                if not args.download:
+        # Keep the scraper session open so all queries share connections
+        with app.scraper:
+            for q in qs:
+                try:
+                    results = app.query(q, provider=args.provider,
+                                        uri=args.uri)
+                except query.MissingFiltersError as e:
+                    msg = "Unknow filters: %s"
+                    msg = msg % ', '.join(e.args[0])
+                    print(msg, file=sys.stderr)
                     continue
 
-                if not args.auto:
-                    userchoice = select_data(len(data))
-                    if userchoice == -1:
-                        print("Skiping %s\n" % entity)
-                        continue
+                if not results:
+                    print("No results", file=sys.stderr)
+                    continue
 
-                    selected = sources[userchoice]
-                    print("Ok, selected: %s\n" % selected.name)
-                else:
-                    selected = sources[0]
+                labels = [' ', ' ', 'state', 'name', 'size', 's/l']
+                columns = ['selected', 'count', 'state', 'name', 'size',
+                           'share']
 
-                try:
-                    app.download(selected)
-                except extensions.ExtensionError as e:
-                    print("Error: %s\n" % e)
+                for (entity, sources) in results:
+                    data = uilib.build_dataset(self.srvs.db, columns, sources)
+                    uilib.display_data(data, labels)
+                    if not args.download:
+                        continue
+
+                    if not args.auto:
+                        userchoice = select_data(len(data))
+                        if userchoice == -1:
+                            print("Skiping %s\n" % entity)
+                            continue
+
+                        selected = sources[userchoice]
+                        print("Ok, selected: %s\n" % selected.name)
+                    else:
+                        selected = sources[0]
+
+                    try:
+                        app.download(selected)
+                    except extensions.ExtensionError as e:
+                        print("Error: %s\n" % e)
 
 
 def queries_from_config(s):
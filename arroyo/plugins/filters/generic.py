@@ -28,6 +28,7 @@ from arroyo import (
 import datetime
 import fnmatch
 import functools
+import operator
 import re
 import time
 
@@ -37,18 +38,25 @@ import humanfriendly
 
 class StateFilter(extensions.Filter):
     HANDLES = ['state']
+    # In-memory set lookup, but the entity key has to be built for each item
+    COST = 2
 
     def filter(self, name, value, item):
+        return self.compile(name, value)(item)
+
+    def compile(self, name, value):
         if value == 'all':
-            return True
+            return lambda item: True
+
+        has_entity = self.srvs.db.downloads.has_entity
 
-        if not item.entity:
-            return True
+        def _filter(item):
+            if not item.entity:
+                return True
 
-        if not self.srvs.db.downloads.sources_for_entity(item.entity):
-            return True
+            return not has_entity(item.entity)
 
-        return False
+        return _filter
 
 
 class SourceAttributeFilter(extensions.Filter):
@@ -67,20 +75,103 @@ class SourceAttributeFilter(extensions.Filter):
         'since',
         'type', 'type-in',
     ]
+    # Attributes with indexes and the type of their values
+    INDEXES = {
+        'created': int,
+        'leechers': int,
+        'provider': str,
+        'seeds': int,
+        'size': int,
+        'type': str,
+    }
+    # Seconds
+    AGE_SLACK = 60
 
     def filter(self, name, value, source):
-        sourcevalue = None
+        return self.compile(name, value)(source)
 
-        if name == 'type' or name.startswith('type-'):
+    def cost(self, name):
+        return pattern_cost(name, self.COST)
+
+    def index(self, name, value):
+        if name == 'age':
+            return None
+
+        # 'age' and 'since' filters also reject items created at 0
+        exact = name not in ('age-min', 'age-max', 'since')
+
+        if name in ('age-min', 'age-max'):
             try:
-                sourcevalue = source.entity.type
-            except AttributeError:
-                return False
+                name, value, _ = self._translate(name, value)
+            except TypeError:
+                return None
 
-        elif name == 'age' or name.startswith('age-'):
-            if not source.created:
-                return False
+            # Predicates and lookups don't see the same current time, widen
+            # ranges a bit so lookups don't leave out accepted items.
+            if name == 'created-max':
+                value = value + self.AGE_SLACK
+            else:
+                value = value - self.AGE_SLACK
+
+        elif name == 'since':
+            name, value, _ = self._translate(name, value)
+
+        basename, fn = eval_filter_name(name)
+        try:
+            target = self.INDEXES[basename]
+        except KeyError:
+            return None
+
+        if basename == 'type':
+            getter = _entity_type
+        else:
+            getter = operator.attrgetter(basename)
+
+        lookup = build_lookup(basename, getter, fn, value, target)
+        if lookup and not exact:
+            lookup = lookup._replace(exact=False)
+
+        return lookup
+
+    def compile(self, name, value):
+        if name == 'type' or name.startswith('type-'):
+            _, fn = eval_filter_name(name)
+            cmp = compile_cmp(fn, value)
+
+            def _filter(source):
+                try:
+                    sourcevalue = source.entity.type
+                except AttributeError:
+                    return False
+
+                return cmp(sourcevalue)
+
+            return _filter
+
+        name, value, required = self._translate(name, value)
+        basename, fn = eval_filter_name(name)
+        cmp = compile_cmp(fn, value)
+        getter = operator.attrgetter(basename)
+
+        if required:
+            def _filter(source):
+                sourcevalue = getter(source)
+                if not sourcevalue:
+                    return False
+
+                return cmp(sourcevalue)
 
+        else:
+            def _filter(source):
+                return cmp(getter(source))
+
+        return _filter
+
+    def _translate(self, name, value):
+        # Translate 'age' and 'since' filters into filters over the 'created'
+        # attribute. Returns the new name and value and the required
+        # attribute, if any.
+        if name == 'age' or name.startswith('age-'):
             now = int(time.time())
             value = now - value
             name = {
@@ -88,22 +179,14 @@ class SourceAttributeFilter(extensions.Filter):
                 'age-min': 'created-max',
                 'age-max': 'created-min'
             }[name]
+            return name, value, 'created'
 
-        elif name == 'since':
-            if not source.created:
-                return False
-
+        if name == 'since':
             dt = humanfriendly.parse_date(value)
             ts = datetime.datetime(*dt).timestamp()
-            value = ts
-            name = 'created-min'
-
-        basename, fn = eval_filter_name(name)
-        if sourcevalue is None:
-            sourcevalue = getattr(source, basename)
+            return 'created-min', ts, 'created'
 
-        value = convert_type(value, sourcevalue)
-        return fn(value, sourcevalue)
+        return name, value, None
 
 
 class MetadataAttributeFilter(extensions.Filter):
@@ -113,44 +196,84 @@ class MetadataAttributeFilter(extensions.Filter):
         'quality',
         'source'
     ]
+    COST = 2
 
     def filter(self, name, value, source):
+        return self.compile(name, value)(source)
+
+    def compile(self, name, value):
         m = {
             'codec': analyze.Tags.VIDEO_CODEC,
             'quality': analyze.Tags.VIDEO_SCREEN_SIZE,
             'source': analyze.Tags.RELEASE_SOURCE
         }
         mkey = m.get(name) or name
-        if not source.metadata or mkey not in source.metadata:
-            return False
 
         # Normalize both values
-        srcvalue = source.metadata[mkey].lower()
         usrvalue = value.lower()
 
         if name == 'codec':
             # Normalize codec values
-            codec_sub = functools.partial(re.sub,
-                                          r'^(h|x)\.?26([45])', r'h26\2')
-            srcvalue = codec_sub(srcvalue)
+            codec_sub = functools.partial(_codec_re.sub, r'h26\2')
             usrvalue = codec_sub(usrvalue)
+        else:
+            codec_sub = None
+
+        def _filter(source):
+            if not source.metadata or mkey not in source.metadata:
+                return False
+
+            srcvalue = source.metadata[mkey].lower()
+            if codec_sub:
+                srcvalue = codec_sub(srcvalue)
 
-        return srcvalue == usrvalue
+            return srcvalue == usrvalue
+
+        return _filter
 
 
 class EntityAttributeFilter(extensions.Filter):
     ENTITY_TYPE = None
     HANDLES = []
+    INDEXES = {}
 
     def filter(self, name, value, source):
-        if not isinstance(source.entity, self.ENTITY_TYPE):
-            return False
+        return self.compile(name, value)(source)
+
+    def cost(self, name):
+        return pattern_cost(name, self.COST)
+
+    def index(self, name, value):
+        basename, fn = eval_filter_name(name)
+        try:
+            target = self.INDEXES[basename]
+        except KeyError:
+            return None
+
+        entity_type = self.ENTITY_TYPE
+
+        def _getter(source):
+            if not isinstance(source.entity, entity_type):
+                return None
 
+            return getattr(source.entity, basename)
+
+        field = '%s.%s' % (entity_type.__name__.lower(), basename)
+        return build_lookup(field, _getter, fn, value, target)
+
+    def compile(self, name, value):
+        entity_type = self.ENTITY_TYPE
         basename, fn = eval_filter_name(name)
+        cmp = compile_cmp(fn, value)
+        getter = operator.attrgetter(basename)
+
+        def _filter(source):
+            if not isinstance(source.entity, entity_type):
+                return False
+
+            return cmp(getter(source.entity))
 
-        sourcevalue = getattr(source.entity, basename)
-        value = convert_type(value, sourcevalue)
-        return fn(value, sourcevalue)
+        return _filter
 
 
 class EpisodeAttributeFilter(EntityAttributeFilter):
@@ -161,10 +284,20 @@ class EpisodeAttributeFilter(EntityAttributeFilter):
         'season', 'season-min', 'season-max',
         'number', 'number-min', 'number-max'
     ]
+    INDEXES = {
+        'number': int,
+        'season': int,
+        'series': str,
+        'year': int,
+    }
+
+    def compile(self, name, value):
+        name = name.replace('series-', '')
+        return super().compile(name, value)
 
-    def filter(self, name, value, item):
+    def index(self, name, value):
         name = name.replace('series-', '')
-        return super().filter(name, value, item)
+        return super().index(name, value)
 
 
 class MovieAttributeFilter(EntityAttributeFilter):
@@ -173,10 +306,119 @@ class MovieAttributeFilter(EntityAttributeFilter):
         'title', 'title-glob', 'title-like',
         'movie-year', 'movie-year-min', 'movie-year-max'
     ]
+    INDEXES = {
+        'title': str,
+        'year': int,
+    }
 
-    def filter(self, name, value, item):
+    def compile(self, name, value):
+        name = name.replace('movie-', '')
+        return super().compile(name, value)
+
+    def index(self, name, value):
         name = name.replace('movie-', '')
-        return super().filter(name, value, item)
+        return super().index(name, value)
+
+
+_codec_re = re.compile(r'^(h|x)\.?26([45])')
+
+
+def pattern_cost(name, cost):
+    # Regex and glob matching is more expensive than plain comparisons
+    if name.endswith('-like') or name.endswith('-glob'):
+        return cost * 4
+
+    return cost
+
+
+def compile_cmp(fn, value):
+    """
+    Bind fn and value into a function of the source value.
+
+    Filter values are converted to the type of the source value (see
+    convert_type) and compiled into a matcher (see MATCHER_COMPILERS) once
+    per type.
+    """
+    compiler = MATCHER_COMPILERS.get(fn)
+    if compiler is None:
+        def compiler(filtervalue):
+            return functools.partial(fn, filtervalue)
+
+    matchers = {}
+
+    def _cmp(sourcevalue):
+        if sourcevalue is None:
+            return fn(value, sourcevalue)
+
+        target = type(sourcevalue)
+        try:
+            matcher = matchers[target]
+        except KeyError:
+            matcher = matchers[target] = compiler(convert_type(value,
+                                                              sourcevalue))
+
+        return matcher(sourcevalue)
+
+    return _cmp
+
+
+def build_lookup(field, getter, fn, value, target):
+    """
+    Build an extensions.IndexLookup for compile_cmp(fn, value) over source
+    values of type target. Returns None if there is no equivalent lookup.
+
+    String equality is case-insensitive (see cmp_eq) so those lookups use
+    their own index of lowercased values.
+    """
+    op = INDEX_OPS.get(fn)
+    if op is None:
+        return None
+
+    if target is str:
+        if op == 'in':
+            value = frozenset(_split_options(str(value)))
+
+        elif op == 'eq':
+            field = field + '.lower'
+            getter = _lowered(getter)
+            value = str(value).lower()
+
+        else:
+            value = str(value)
+
+    elif op == 'in':
+        return None
+
+    else:
+        try:
+            value = target(value)
+        except (TypeError, ValueError):
+            return None
+
+    return extensions.IndexLookup(field, getter, op, value)
+
+
+def compile_like(pattern):
+    match = re.compile(pattern).match
+
+    def _like(sourcevalue):
+        return match(sourcevalue) is not None
+
+    return _like
+
+
+def compile_glob(pattern):
+    # Same as fnmatch.fnmatch on posix systems (no case normalization)
+    match = re.compile(fnmatch.translate(pattern)).match
+
+    def _glob(sourcevalue):
+        return match(sourcevalue) is not None
+
+    return _glob
+
+
+def compile_in(options):
+    return frozenset(_split_options(options)).__contains__
 
 
 def convert_type(value, target):
@@ -238,5 +480,44 @@ def cmp_like(filtervalue, sourcevalue):
 
 
 def cmp_in(options, sourcevalue):
-    options = [x.strip() for x in options.split(',')]
-    return sourcevalue in options
+    return sourcevalue in _split_options(options)
+
+
+def _split_options(options):
+    return [x.strip() for x in options.split(',')]
+
+
+def _entity_type(source):
+    if not source.entity:
+        return None
+
+    return source.entity.type
+
+
+def _lowered(getter):
+    def _get(item):
+        value = getter(item)
+        if isinstance(value, str):
+            value = value.lower()
+
+        return value
+
+    return _get
+
+
+# Functions to precompile filter values for some comparison functions.
+# Compilers take the filter value and return a function of the source value.
+MATCHER_COMPILERS = {
+    cmp_like: compile_like,
+    cmp_glob: compile_glob,
+    cmp_in: compile_in,
+}
+
+# Index operations (see extensions.IndexLookup) equivalent to comparison
+# functions
+INDEX_OPS = {
+    cmp_eq: 'eq',
+    cmp_in: 'in',
+    cmp_min: 'min',
+    cmp_max: 'max',
+}
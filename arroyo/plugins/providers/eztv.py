@@ -38,6 +38,10 @@ class EzTV(extensions.Provider):
         r'^http(s)?://([^.]\.)?eztv\.[^.]{2,3}/'
     ]
 
+    RATE_LIMIT = 1
+    RATE_BURST = 2
+    MAX_IN_FLIGHT = 2
+
     def paginate(self, uri):
         parsed = parse.urlparse(uri)
         pathcomponents = parsed.path.split('/')
@@ -86,12 +90,28 @@ class EzTV(extensions.Provider):
             q=parse.quote_plus(q))
 
     def parse(self, buffer):
+        if self.html_backend == 'lxml-tree':
+            return self.parse_tree(self.parse_as_tree(buffer))
+
         soup = self.parse_as_soup(buffer)
         rows = self.parse_page(soup)
         items = [self.parse_row(row) for row in rows]
 
         return items
 
+    def parse_tree(self, tree):
+        ret = []
+
+        for link in tree.xpath('//a[starts-with(@href, "magnet")]'):
+            row = next(link.iterancestors('tr'))
+            magnet = row.xpath('.//a[starts-with(@href, "magnet:?")]/@href')
+            magnet = str(magnet[0])
+            text = row.text_content()
+
+            ret.append(self.build_item(self.parse_name(magnet), magnet, text))
+
+        return ret
+
     def parse_page(self, soup):
         # Get links with magnets
         magnets = [x for x in soup.select('a')
@@ -105,13 +125,16 @@ class EzTV(extensions.Provider):
     def parse_row(self, row):
         # Get magnet and name from the magnet link
         name, magnet = self.parse_name_and_uri(row)
+        return self.build_item(name, magnet, str(row))
+
+    def build_item(self, name, magnet, html):
         try:
-            size = self.parse_size(row)
+            size = self.parse_size(html)
         except ValueError:
             size = None
 
         try:
-            timestamp = self.parse_timestamp(row)
+            timestamp = self.parse_timestamp(html)
         except ValueError:
             timestamp = None
 
@@ -127,10 +150,13 @@ class EzTV(extensions.Provider):
     def parse_name_and_uri(self, node):
         magnet = [x for x in node.select('a')
                   if x.attrs.get('href').startswith('magnet:?')][0]
-        parsed = parse.urlparse(magnet.attrs['href'])
-        name = parse.parse_qs(parsed.query)['dn'][0]
+        magnet = magnet.attrs['href']
+
+        return (self.parse_name(magnet), magnet)
 
-        return (name, magnet.attrs['href'])
+    def parse_name(self, magnet):
+        parsed = parse.urlparse(magnet)
+        return parse.parse_qs(parsed.query)['dn'][0]
 
     def parse_size(self, node):
         s = str(node)
@@ -55,6 +55,10 @@ class ThePirateBay(extensions.Provider):
         r'^http(s)?://([^.]+.)?thepiratebay\.[^.]{2,3}/(?!rss/)'
     ]
 
+    RATE_LIMIT = 1
+    RATE_BURST = 2
+    MAX_IN_FLIGHT = 2
+
     SEARCH_URL_PATTERN = (
         "{proto}://thepiratebay.{tld}".format(proto=PROTO, tld=TLD) +
         "/search/{q}/0/99/0"
@@ -154,39 +158,21 @@ class ThePirateBay(extensions.Provider):
             page += 1
 
     def parse(self, buff):
+        if self.html_backend == 'lxml-tree':
+            return self.parse_tree(self.parse_as_tree(buff))
+
         def parse_row(row):
-            details = row.select('font.detDesc')[0].text
-
-            # Parse category
-            try:
-                typ = self.parse_category(row.select('td')[0].text)
-            except _CategoryUnknowError as e:
-                typ = 'other'
-                msg = "Unknow category: '{category}'"
-                msg = msg.format(category=e.args[0])
-                print(msg, file=sys.stderr)
-
-            # Parse size
-            size = re.findall(r'([0-9\.]+\s*[GMK]i?B)',
-                              details,
-                              re.IGNORECASE)[0]
-            size = humanfriendly.parse_size(size)
-
-            # Parse created
-            try:
-                created = self.parse_timestamp(row.select('.detDesc')[0].text)
-            except IndexError:
-                created = 'other'
-
-            return {
-                'name': row.findAll('a')[2].text,
-                'uri': row.findAll('a')[3]['href'],
-                'type': typ,
-                'size': size,
-                'created': created,
-                'seeds': int(row.findAll('td')[-2].text),
-                'leechers': int(row.findAll('td')[-1].text)
-            }
+            links = row.findAll('a')
+            cells = row.findAll('td')
+
+            return self.build_item(
+                category=cells[0].text,
+                details=row.select('font.detDesc')[0].text,
+                created=row.select('.detDesc')[0].text,
+                name=links[2].text,
+                uri=links[3]['href'],
+                seeds=cells[-2].text,
+                leechers=cells[-1].text)
 
         def filter_row(row):
             return any((link.attrs.get('href', '').startswith('magnet')
@@ -198,6 +184,60 @@ class ThePirateBay(extensions.Provider):
 
         return list(map(parse_row, rows))
 
+    def parse_tree(self, tree):
+        def has_class(cls):
+            return ('contains(concat(" ", normalize-space(@class), " "), '
+                    '" %s ")' % cls)
+
+        details_xpath = './/font[%s]' % has_class('detDesc')
+        created_xpath = './/*[%s]' % has_class('detDesc')
+
+        def parse_row(row):
+            links = row.xpath('.//a')
+            cells = row.xpath('.//td')
+
+            return self.build_item(
+                category=cells[0].text_content(),
+                details=row.xpath(details_xpath)[0].text_content(),
+                created=row.xpath(created_xpath)[0].text_content(),
+                name=links[2].text_content(),
+                uri=links[3].attrib['href'],
+                seeds=cells[-2].text_content(),
+                leechers=cells[-1].text_content())
+
+        rows = tree.xpath('//tr[.//a[starts-with(@href, "magnet")]]')
+        return [parse_row(row) for row in rows]
+
+    def build_item(self, category, details, created, name, uri, seeds,
+                   leechers):
+        # Parse category
+        try:
+            typ = self.parse_category(category)
+        except _CategoryUnknowError as e:
+            typ = 'other'
+            msg = "Unknow category: '{category}'"
+            msg = msg.format(category=e.args[0])
+            print(msg, file=sys.stderr)
+
+        # Parse size
+        size = re.findall(r'([0-9\.]+\s*[GMK]i?B)',
+                          details,
+                          re.IGNORECASE)[0]
+        size = humanfriendly.parse_size(size)
+
+        # Parse created
+        created = self.parse_timestamp(created)
+
+        return {
+            'name': name,
+            'uri': uri,
+            'type': typ,
+            'size': size,
+            'created': created,
+            'seeds': int(seeds),
+            'leechers': int(leechers)
+        }
+
     @classmethod
     def parse_category(cls, text):
         cat = text.lower()
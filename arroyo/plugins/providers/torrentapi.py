@@ -39,16 +39,12 @@
 #  'title': 'Westworld.S01E10.iNTERNAL.HDTV.x264-TURBO[rartv]'}
 
 
-import asyncio
 import datetime
 import json
 import time
 from urllib import parse
 
 
-import aiohttp
-
-
 from arroyo import (
     extensions,
     schema
@@ -70,6 +66,13 @@ class TorrentAPI(extensions.Provider):
         r'^http(s)?://([^.]+.)?torrentapi\.org/pubapi_v2.php\?'
     ]
 
+    # API allows one request every two seconds
+    RATE_LIMIT = 0.5
+    MAX_IN_FLIGHT = 1
+
+    # Seconds
+    TOKEN_TTL = 15*60
+
     CATEGORY_MAP = {
         schema.get_entity_name(schema.Episode): 'tv',
         schema.get_entity_name(schema.Movie): 'movies'
@@ -81,11 +84,15 @@ class TorrentAPI(extensions.Provider):
         # self.logger = self.app.logger.getChild('torrentapi')
         self.token = None
         self.token_ts = 0
-        self.token_last_use = 0
 
-    async def fetch(self, fetcher, uri):
-        await self.refresh_token()
-        await asyncio.sleep(0.5)
+    async def prepare_fetch(self, sess, uri, throttle):
+        # Token requests count against the API rate limit too
+        if self.token_expired:
+            await throttle()
+            await self.refresh_token(sess)
+
+    async def fetch(self, fetcher, uri, headers=None):
+        await self.refresh_token(fetcher)
         uri = alter_query_params(
             uri,
             dict(
@@ -94,34 +101,23 @@ class TorrentAPI(extensions.Provider):
                 sort='last',
                 token=self.token)
         )
-        return await super().fetch(fetcher, uri)
-
-    async def refresh_token(self):
-        # Refresh token if it's older than 15M
-        if time.time() - self.token_ts >= 15*60:
-            conn = aiohttp.TCPConnector(verify_ssl=False)
-            client = aiohttp.ClientSession(connector=conn)
-            resp = await client.get(self.TOKEN_URI)
-            buff = await resp.content.read()
-            await resp.release()
-            await client.close()
+        return await super().fetch(fetcher, uri, headers=headers)
+
+    @property
+    def token_expired(self):
+        return time.time() - self.token_ts >= self.TOKEN_TTL
+
+    async def refresh_token(self, sess):
+        if self.token_expired:
+            # Token endpoint has always been requested without certificate
+            # verification, keep it that way on the shared session
+            async with sess.get(self.TOKEN_URI, ssl=False) as resp:
+                buff = await resp.content.read()
 
             # FIXME: Handle json.JSONDecodeError
             self.token = json.loads(buff.decode('utf-8'))['token']
 
             self.token_ts = time.time()
-            self.token_last_use = None
-            return
-
-        # No need to throttle
-        if self.token_last_use is None:
-            return
-
-        # throttle
-        now = time.time()
-        since_last_use = self.token_last_use - now
-        if since_last_use < 2:
-            await asyncio.sleep(2 - since_last_use)
 
     def parse(self, buff):
         def convert_data(e):
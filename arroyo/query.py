@@ -18,6 +18,16 @@
 # USA.
 
 
+import bisect
+
+
+try:
+    import numpy
+    _has_numpy = True
+except ImportError:
+    _has_numpy = False
+
+
 from arroyo import (
     analyze,
     schema
@@ -127,25 +137,407 @@ class Query(dict):
             raise NotImplementedError(err)
 
 
+class CollectionIndex:
+    """
+    Secondary indexes over a collection.
+
+    Indexes are built on first use for each field (see
+    extensions.IndexLookup): hash indexes (value to positions) for 'eq' and
+    'in' lookups, sorted indexes for 'min' and 'max' range scans. Items with
+    no value for a field are not indexed.
+
+    Building an index costs about the same as a scan, reuse the same
+    CollectionIndex for several queries over a collection.
+    """
+    def __init__(self, collection):
+        self.collection = list(collection)
+        self.hashes = {}
+        self.sorted = {}
+
+    def __len__(self):
+        return len(self.collection)
+
+    def _values(self, getter):
+        for (pos, item) in enumerate(self.collection):
+            try:
+                value = getter(item)
+            except AttributeError:
+                continue
+
+            if value is not None:
+                yield (value, pos)
+
+    def hash_index(self, field, getter):
+        try:
+            return self.hashes[field]
+        except KeyError:
+            pass
+
+        index = {}
+        for (value, pos) in self._values(getter):
+            index.setdefault(value, []).append(pos)
+
+        self.hashes[field] = index
+        return index
+
+    def sorted_index(self, field, getter):
+        try:
+            return self.sorted[field]
+        except KeyError:
+            pass
+
+        pairs = sorted(self._values(getter))
+        index = ([value for (value, _) in pairs],
+                 [pos for (_, pos) in pairs])
+
+        self.sorted[field] = index
+        return index
+
+    def lookup(self, lookup):
+        """
+        Returns the set of positions of items matching lookup
+        """
+        if lookup.op == 'eq':
+            index = self.hash_index(lookup.field, lookup.getter)
+            return set(index.get(lookup.value, ()))
+
+        if lookup.op == 'in':
+            index = self.hash_index(lookup.field, lookup.getter)
+            ret = set()
+            for value in lookup.value:
+                ret.update(index.get(value, ()))
+
+            return ret
+
+        keys, positions = self.sorted_index(lookup.field, lookup.getter)
+        if lookup.op == 'min':
+            return set(positions[bisect.bisect_left(keys, lookup.value):])
+
+        if lookup.op == 'max':
+            return set(positions[:bisect.bisect_right(keys, lookup.value)])
+
+        raise ValueError(lookup.op)
+
+    def candidates(self, lookups):
+        """
+        Returns sorted positions of items matching all lookups or None if
+        there are no lookups
+        """
+        ret = None
+        for lookup in lookups:
+            positions = self.lookup(lookup)
+            ret = positions if ret is None else ret & positions
+            if not ret:
+                break
+
+        if ret is None:
+            return None
+
+        return sorted(ret)
+
+
+class ColumnarIndex(CollectionIndex):
+    """
+    CollectionIndex holding numeric fields as NumPy arrays.
+
+    Numeric 'eq', 'min' and 'max' lookups are evaluated as vectorized
+    boolean masks over those columns (items with no value are masked out).
+    Other lookups are turned into masks from the regular hash indexes. Masks
+    from all lookups are combined before going back to item positions.
+
+    Requires numpy.
+    """
+    def __init__(self, collection):
+        if not _has_numpy:
+            raise ImportError('numpy')
+
+        super().__init__(collection)
+        self.columns = {}
+        self.positions = {}
+
+    def column(self, field, getter):
+        """
+        Returns a (values, valid) pair of arrays or None if field is not
+        numeric
+        """
+        try:
+            return self.columns[field]
+        except KeyError:
+            pass
+
+        values = [0] * len(self.collection)
+        valid = numpy.zeros(len(self.collection), dtype=bool)
+        for (value, pos) in self._values(getter):
+            if not _is_number(value):
+                column = None
+                break
+
+            values[pos] = value
+            valid[pos] = True
+
+        else:
+            column = (numpy.array(values), valid)
+            if column[0].dtype.kind not in 'iuf':
+                column = None
+
+        self.columns[field] = column
+        return column
+
+    def hash_positions(self, field, getter, value):
+        key = (field, value)
+        try:
+            return self.positions[key]
+        except KeyError:
+            pass
+
+        index = self.hash_index(field, getter)
+        ret = self.positions[key] = numpy.array(index.get(value, ()),
+                                                dtype=numpy.intp)
+        return ret
+
+    def mask(self, lookup):
+        """
+        Returns a boolean mask of items matching lookup
+        """
+        if lookup.op in ('eq', 'min', 'max') and _is_number(lookup.value):
+            column = self.column(lookup.field, lookup.getter)
+        else:
+            column = None
+
+        if column is not None:
+            values, valid = column
+            if lookup.op == 'eq':
+                return valid & (values == lookup.value)
+
+            if lookup.op == 'min':
+                return valid & (values >= lookup.value)
+
+            return valid & (values <= lookup.value)
+
+        ret = numpy.zeros(len(self.collection), dtype=bool)
+        if lookup.op == 'eq':
+            ret[self.hash_positions(lookup.field, lookup.getter,
+                                    lookup.value)] = True
+
+        elif lookup.op == 'in':
+            for value in lookup.value:
+                ret[self.hash_positions(lookup.field, lookup.getter,
+                                        value)] = True
+
+        else:
+            # Range scans over non numeric fields
+            ret[list(self.lookup(lookup))] = True
+
+        return ret
+
+    def candidates(self, lookups):
+        mask = None
+        for lookup in lookups:
+            if mask is None:
+                mask = self.mask(lookup)
+            else:
+                mask &= self.mask(lookup)
+
+            if not mask.any():
+                break
+
+        if mask is None:
+            return None
+
+        return numpy.flatnonzero(mask).tolist()
+
+
+class FilterPlan:
+    """
+    Compiled filter context.
+
+    Each (filter, key, value) triple is compiled into a predicate once, then
+    items are checked against all of them in a single pass, stopping at the
+    first predicate that fails.
+
+    Predicates are ordered by expected cost per rejected item: cost comes
+    from Filter.cost, selectivity (ratio of items passing) from runtime
+    statistics, kept per (key, value) pair. Plans sharing a `stats` dict
+    (i.e. from the same engine) learn from each other. Order is reevaluated
+    on each call to apply.
+
+    If a CollectionIndex is passed to apply, filters with index lookups (see
+    Filter.index) narrow the candidates first and only filters without
+    exact lookups are applied over them. Counters only count the candidates
+    in that case.
+
+    Iterating over a plan yields the original triples.
+    """
+    # Minimal number of samples before trusting collected selectivity
+    MIN_SAMPLES = 20
+    DEFAULT_SELECTIVITY = 0.5
+
+    def __init__(self, filters, stats=None):
+        self.filters = list(filters)
+        self.predicates = [f.compile(key, value)
+                           for (f, key, value) in self.filters]
+        self.costs = [f.cost(key) for (f, key, _) in self.filters]
+        self.lookups = [f.index(key, value)
+                        for (f, key, value) in self.filters]
+        self.stats_keys = [_stats_key(key, value)
+                           for (_, key, value) in self.filters]
+
+        # Per filter [seen, passed] counters, for this plan and shared
+        self.counts = [[0, 0] for _ in self.filters]
+        self.stats = stats if stats is not None else {}
+
+        self.order = list(range(len(self.filters)))
+
+    def __iter__(self):
+        return iter(self.filters)
+
+    def __len__(self):
+        return len(self.filters)
+
+    def selectivity(self, idx):
+        seen, passed = self.stats.get(self.stats_keys[idx], (0, 0))
+        if seen < self.MIN_SAMPLES:
+            return self.DEFAULT_SELECTIVITY
+
+        return passed / seen
+
+    def rank(self, idx):
+        # Classic predicate ordering: cost per rejected item. Filters that
+        # reject nothing go last.
+        rejected = 1 - self.selectivity(idx)
+        if rejected <= 0:
+            return float('inf')
+
+        return self.costs[idx] / rejected
+
+    def optimize(self):
+        self.order = sorted(range(len(self.filters)),
+                            key=lambda idx: (self.rank(idx), idx))
+
+    def match(self, item):
+        for idx in self.order:
+            if not self.predicates[idx](item):
+                return False
+
+        return True
+
+    def candidates(self, index):
+        """
+        Returns sorted positions of items from index.collection matching
+        all index lookups or None if no filter can use indexes
+        """
+        return index.candidates([x for x in self.lookups if x is not None])
+
+    def apply(self, collection, index=None):
+        skip = set()
+        if index is not None:
+            positions = self.candidates(index)
+            if positions is not None:
+                collection = [index.collection[pos] for pos in positions]
+                # Filters with exact lookups are already applied
+                skip = set(idx for (idx, lookup) in enumerate(self.lookups)
+                           if lookup and lookup.exact)
+
+        self.optimize()
+
+        order = [idx for idx in self.order if idx not in skip]
+        preds = [(idx, self.predicates[idx]) for idx in order]
+        rejected = [0] * len(self.filters)
+
+        ret = []
+        for item in collection:
+            for (idx, pred) in preds:
+                if not pred(item):
+                    rejected[idx] += 1
+                    break
+            else:
+                ret.append(item)
+
+        # Update counters: each filter sees items not rejected by previous
+        # ones
+        seen = len(collection)
+        for idx in order:
+            passed = seen - rejected[idx]
+            self.counts[idx][0] += seen
+            self.counts[idx][1] += passed
+
+            stats = self.stats.setdefault(self.stats_keys[idx], [0, 0])
+            stats[0] += seen
+            stats[1] += passed
+
+            seen = passed
+
+        return ret
+
+    def explain(self):
+        """
+        Returns a list of dicts describing each filter in execution order
+        """
+        ret = []
+        for idx in self.order:
+            (f, key, value) = self.filters[idx]
+            seen, passed = self.counts[idx]
+            ret.append({
+                'filter': key,
+                'value': value,
+                'cost': self.costs[idx],
+                'indexed': self.lookups[idx] is not None,
+                'selectivity': self.selectivity(idx),
+                'seen': seen,
+                'passed': passed
+            })
+
+        return ret
+
+
 class Engine:
     def __init__(self, srvs, logger=None):
         self.srvs = srvs
         self.logger = logger or self.srvs.logger.getChild('query.Engine')
+        # Selectivity statistics shared by all plans from this engine
+        self.stats = {}
+        # Filter dispatch table (name -> plugin), rebuilt when the loader
+        # changes
+        self._plugins = []
+        self._handlers = None
+        self._handlers_version = None
 
     def get_sorter(self):
         name = self.srvs.settings.get('sorter')
-        return self.srvs.loader.get('sorters.' + name, self.srvs)
+        return self.srvs.loader.get_instance('sorters.' + name, self.srvs)
 
     def get_filter(self, name):
-        plugins = [self.srvs.loader.get(x, self.srvs)
-                   for x in self.srvs.loader.list('filters')]
+        loader = self.srvs.loader
+        if self._handlers is None or self._handlers_version != loader.version:
+            self._handlers = self._build_handlers()
+            self._handlers_version = loader.version
+
+        try:
+            return self._handlers[name]
+        except KeyError:
+            pass
 
-        for plugin in plugins:
+        # Filters may handle names not listed in HANDLES
+        for plugin in self._plugins:
             if plugin.can_handle(name):
+                self._handlers[name] = plugin
                 return plugin
 
         raise MissingFilterError(name)
 
+    def _build_handlers(self):
+        self._plugins = [self.srvs.loader.get_instance(x, self.srvs)
+                         for x in self.srvs.loader.list('filters')]
+
+        # First plugin wins, like a sequential lookup would do
+        ret = {}
+        for plugin in self._plugins:
+            for name in plugin.HANDLES:
+                if name not in ret and plugin.can_handle(name):
+                    ret[name] = plugin
+
+        return ret
+
     def build_filter_context(self, query):
         filters = []
         missing = []
@@ -165,26 +557,66 @@ class Engine:
         if missing:
             raise MissingFiltersError(missing)
 
-        return filters
+        return FilterPlan(filters, stats=self.stats)
 
-    def apply(self, ctx, collection, mp=True):
-        ret = collection
-        for (f, key, value) in ctx:
-            prev = len(ret)
-            ret = f.apply(key, value, ret)
-            curr = len(ret)
+    def build_index(self, collection, columnar=False):
+        """
+        Build a CollectionIndex over collection.
 
-            logmsg = "applied filter '%s' over %s items: %s items left"
-            logmsg = logmsg % (key, prev, curr)
-            self.srvs.logger.debug(logmsg)
+        Building an index costs more than a single filter pass, it only pays
+        off when several filter contexts are applied over the same
+        collection.
 
-            if not ret:
-                logmsg = "skipping remaing filters"
-                self.srvs.logger.debug(logmsg)
-                break
+        If columnar is True numeric fields are evaluated by a ColumnarIndex,
+        it falls back to a CollectionIndex if numpy is not available.
+        """
+        if columnar:
+            if _has_numpy:
+                return ColumnarIndex(collection)
+
+            logmsg = "numpy not available, columnar index disabled"
+            self.logger.warning(logmsg)
+
+        return CollectionIndex(collection)
+
+    def apply(self, ctx, collection, mp=True, index=None):
+        """
+        Apply filter context over collection.
+
+        index, if given, must be a CollectionIndex built over collection
+        (see build_index).
+        """
+        if not isinstance(ctx, FilterPlan):
+            ctx = FilterPlan(ctx, stats=self.stats)
+
+        collection = list(collection)
+        ret = ctx.apply(collection, index=index)
+
+        logmsg = "applied %s filters over %s items: %s items left"
+        logmsg = logmsg % (len(ctx), len(collection), len(ret))
+        self.srvs.logger.debug(logmsg)
+
+        for row in ctx.explain():
+            logmsg = "  %(filter)s=%(value)s: %(passed)s/%(seen)s passed"
+            logmsg = logmsg % row
+            self.srvs.logger.debug(logmsg)
 
         return ret
 
+    def explain(self, ctx):
+        """
+        Human readable description of plan execution order and counters
+        """
+        lines = ["%-20s %-20s %6s %6s %5s %8s %8s" % (
+            'filter', 'value', 'cost', 'sel', 'index', 'seen', 'passed')]
+        for row in ctx.explain():
+            lines.append("%-20s %-20s %6s %6.2f %5s %8s %8s" % (
+                row['filter'], row['value'], row['cost'],
+                row['selectivity'], 'yes' if row['indexed'] else 'no',
+                row['seen'], row['passed']))
+
+        return '\n'.join(lines)
+
     def sort(self, collection):
         groups = {}
 
@@ -210,6 +642,21 @@ class Engine:
         return ret
 
 
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _stats_key(key, value):
+    # Selectivity depends on the value too: quality=720p and quality=2160p
+    # don't reject the same items
+    try:
+        hash(value)
+    except TypeError:
+        value = repr(value)
+
+    return (key, value)
+
+
 class MissingFilterError(Exception):
     pass
 
@@ -35,7 +35,66 @@ ValidationError = pydantic.ValidationError
 # Entity definitions
 #
 
-class Episode(pydantic.BaseModel):
+class _Entity(pydantic.BaseModel):
+    """
+    Base class for entities.
+
+    Entities are immutable so their identity (normalized key, id and hash)
+    is computed once and cached.
+    """
+    # Private attributes require pydantic >= 1.7 (see requirements.txt)
+    _key = pydantic.PrivateAttr(default=None)
+    _id = pydantic.PrivateAttr(default=None)
+    _hash = pydantic.PrivateAttr(default=None)
+
+    class Config:
+        allow_mutation = False
+
+    @property
+    def key(self):
+        """
+        Case-insensitive identity of the entity
+        """
+        if self._key is None:
+            self._key = self._build_key()
+
+        return self._key
+
+    @property
+    def id(self):
+        if self._id is None:
+            dig = hashlib.sha1()
+            dig.update('\0'.join(self._build_id_parts()).encode('utf-8'))
+            self._id = dig.hexdigest()
+
+        return self._id
+
+    def _build_key(self):
+        raise NotImplementedError()
+
+    def _build_id_parts(self):
+        raise NotImplementedError()
+
+    def __eq__(self, x):
+        return isinstance(x, self.__class__) and self.key == x.key
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.key)
+
+        return self._hash
+
+    def __getstate__(self):
+        # String hashes are randomized per process, don't carry the cached
+        # one over to other processes
+        state = super().__getstate__()
+        state['__private_attribute_values__'] = dict(
+            state['__private_attribute_values__'], _hash=None)
+
+        return state
+
+
+class Episode(_Entity):
     type: typing_extensions.Literal['episode']
     series: str
     year: typing.Optional[int]
@@ -43,62 +102,41 @@ class Episode(pydantic.BaseModel):
     number: int
     country: typing.Optional[str]
 
-    @property
-    def id(self):
-        dig = hashlib.sha1()
-        s = '\0'.join([
+    def _build_id_parts(self):
+        return [
             self.type,
             self.series,
             str(self.year or ''),
             str(self.season),
             str(self.number),
             self.country or '',
-        ])
-        dig.update(s.encode('utf-8'))
-        return dig.hexdigest()
-
-    def __eq__(self, x):
-        return (isinstance(x, self.__class__)
-                and self.series.lower() == x.series.lower()
-                and self.year == x.year
-                and self.season == x.season
-                and self.number == x.number
-                and (self.country or '').lower() == (x.country or '').lower())
+        ]
 
-    def __hash__(self):
-        return hash((self.series.lower(),
-                     self.year,
-                     self.season,
-                     self.number,
-                     (self.country or '').lower()))
+    def _build_key(self):
+        return (self.series.lower(),
+                self.year,
+                self.season,
+                self.number,
+                (self.country or '').lower())
 
     def __repr__(self):
         return f'<Episode id={self.id}>'
 
 
-class Movie(pydantic.BaseModel):
+class Movie(_Entity):
     type: typing_extensions.Literal['movie']
     title: str
     year: typing.Optional[int]
 
-    @property
-    def id(self):
-        dig = hashlib.sha1()
-        s = '\0'.join([
+    def _build_id_parts(self):
+        return [
             self.type,
             self.title,
             str(self.year or '')
-        ])
-        dig.update(s.encode('utf-8'))
-        return dig.hexdigest()
+        ]
 
-    def __eq__(self, x):
-        return (isinstance(x, self.__class__)
-                and self.title.lower() == x.title.lower()
-                and self.year == x.year)
-
-    def __hash__(self):
-        return hash((self.title.lower(), self.year))
+    def _build_key(self):
+        return (self.title.lower(), self.year)
 
     def __repr__(self):
         return f'<Movie id={self.id}>'
@@ -124,12 +162,33 @@ class Source(pydantic.BaseModel):
     metadata: MetadataType = {}
 
     def __init__(self, *args, **kwargs):
-        parsed = parse.urlparse(kwargs['uri'])
-        qs = dict(parse.parse_qsl(parsed.query))
-        kwargs['id'] = qs['xt'].split(':')[2]
-
+        kwargs['id'] = _id_from_uri(kwargs['uri'])
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def from_trusted(cls, data):
+        """
+        Build a Source from already validated data, like the output of
+        Source.dict() stored in the database.
+
+        Validation and URI parsing are skipped, use only with data produced
+        by arroyo itself.
+        """
+        data = dict(data)
+        for k in ('hints', 'metadata'):
+            if k in data:
+                data[k] = dict(data[k])
+
+        if 'id' not in data:
+            data['id'] = _id_from_uri(data['uri'])
+
+        entity = data.get('entity')
+        if isinstance(entity, dict):
+            data['entity'] = get_entity_class(entity['type']).construct(
+                **entity)
+
+        return cls.construct(**data)
+
     def __hash__(self):
         return hash(self.id)
 
@@ -140,6 +199,12 @@ class Source(pydantic.BaseModel):
         return self.name
 
 
+def _id_from_uri(uri):
+    parsed = parse.urlparse(uri)
+    qs = dict(parse.parse_qsl(parsed.query))
+    return qs['xt'].split(':')[2]
+
+
 entity_type_map = {
     'episode': Episode,
     'movie': Movie
@@ -19,6 +19,15 @@
 
 
 import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import queue
+import random
+import threading
+import time
+from urllib import parse
 
 
 import aiohttp
@@ -29,7 +38,10 @@ from arroyo import (
     extensions,
     schema
 )
-from arroyo.services import cache
+from arroyo.services import (
+    Services,
+    cache
+)
 
 
 class Context:
@@ -61,21 +73,275 @@ class Context:
             hexid=hex(id(self)))
 
 
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostScheduler:
+    """
+    Politeness scheduler.
+
+    Requests to the same host share a token bucket and an in-flight limit
+    taken from the provider class (see extensions.Provider.RATE_LIMIT,
+    RATE_BURST and MAX_IN_FLIGHT). Limits are set up by the first provider
+    requesting each host.
+
+    slot() only takes the in-flight limit, it yields a coroutine function
+    which must be awaited right before sending each request to take a token
+    from the bucket.
+    """
+    def __init__(self):
+        self._buckets = {}
+        self._in_flight = {}
+
+    @staticmethod
+    def host(uri):
+        return parse.urlparse(uri).netloc.lower()
+
+    def _setup(self, provider, host):
+        if host in self._in_flight:
+            return
+
+        if provider.RATE_LIMIT:
+            self._buckets[host] = TokenBucket(provider.RATE_LIMIT,
+                                              provider.RATE_BURST)
+
+        if provider.MAX_IN_FLIGHT:
+            self._in_flight[host] = asyncio.Semaphore(provider.MAX_IN_FLIGHT)
+        else:
+            self._in_flight[host] = None
+
+    @contextlib.asynccontextmanager
+    async def slot(self, provider, uri):
+        host = self.host(uri)
+        self._setup(provider, host)
+
+        sem = self._in_flight[host]
+        if sem:
+            await sem.acquire()
+
+        bucket = self._buckets.get(host)
+
+        async def _throttle():
+            if bucket:
+                await bucket.acquire()
+
+        try:
+            yield _throttle
+
+        finally:
+            if sem:
+                sem.release()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter.
+
+    The limit grows by one after `limit` consecutive requests complete with
+    latencies under `tolerance` times the best latency seen so far, and it's
+    halved on any error (timeouts, 429 or 5xx responses).
+    """
+    def __init__(self, initial=1, minimum=1, maximum=10, tolerance=2.0,
+                 window=100):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.min_latency = None
+
+        self._successes = 0
+        self._cond = None
+        self._cond_loop = None
+
+    def _condition(self):
+        # Limiters outlive event loops, conditions don't
+        loop = asyncio.get_running_loop()
+        if self._cond_loop is not loop:
+            self._cond = asyncio.Condition()
+            self._cond_loop = loop
+
+        return self._cond
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        cond = self._condition()
+
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+        try:
+            yield
+
+        finally:
+            async with cond:
+                self.in_flight -= 1
+                cond.notify_all()
+
+    def record(self, latency=None, error=False):
+        if error:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._successes = 0
+            return
+
+        self.latencies.append(latency)
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+
+        if latency > self.min_latency * self.tolerance:
+            self._successes = 0
+            return
+
+        self._successes += 1
+        if self._successes >= int(self.limit):
+            self.limit = min(self.maximum, int(self.limit) + 1)
+            self._successes = 0
+
+    def percentiles(self, *ps):
+        ps = ps or (50, 90, 99)
+        data = sorted(self.latencies)
+        if not data:
+            return {p: None for p in ps}
+
+        return {p: data[min(len(data) - 1, int(len(data) * p / 100))]
+                for p in ps}
+
+    def stats(self):
+        return {
+            'limit': int(self.limit),
+            'in-flight': self.in_flight,
+            'latency': self.percentiles()
+        }
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open requests
+    should be skipped. Once `cooldown` seconds have passed the breaker is
+    half-open: allow() lets exactly one probe request through and rejects
+    the rest until the probe is recorded. Success closes the breaker,
+    failure re-opens it.
+    """
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+
+        return 'half-open'
+
+    @property
+    def is_open(self):
+        return self.state == 'open'
+
+    def allow(self):
+        """
+        Check if a request can be done. In half-open state the first caller
+        becomes the probe, it must call record (or release) when done.
+        """
+        state = self.state
+        if state == 'closed':
+            return True
+
+        if state == 'open' or self.probing:
+            return False
+
+        self.probing = True
+        return True
+
+    def release(self):
+        # Probe finished without a result (i.e. it was cancelled)
+        self.probing = False
+
+    def record(self, error=False, probe=False):
+        if probe:
+            self.probing = False
+
+        if not error:
+            self.failures = 0
+            self.opened_at = None
+            return
+
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
 class Engine:
     def __init__(self, srvs, logger=None):
         self.srvs = srvs
         self.logger = logger or self.srvs.logger.getChild('scraper.Engine')
 
+        self._loop = None
+        self._sess = None
+        self._scheduler = None
+        self._in_flight = {}
+        self._limiters = {}
+        self._breakers = {}
+        self._executor = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    INT_SETTINGS = (
+        defaults.KEY_SCRAPER_BREAKER_THRESHOLD,
+        defaults.KEY_SCRAPER_KEEPALIVE_TIMEOUT,
+        defaults.KEY_SCRAPER_MAX_PARALEL_REQUESTS,
+        defaults.KEY_SCRAPER_PARSE_WORKERS,
+        defaults.KEY_SCRAPER_RETRIES,
+        defaults.KEY_SCRAPER_TIMEOUT,
+    )
+    FLOAT_SETTINGS = (
+        defaults.KEY_SCRAPER_BREAKER_COOLDOWN,
+        defaults.KEY_SCRAPER_RETRY_BACKOFF,
+    )
+
     def setting(self, key):
         ret = self.srvs.settings.get(key)
 
-        if key in (defaults.KEY_SCRAPER_TIMEOUT,
-                   defaults.KEY_SCRAPER_MAX_PARALEL_REQUESTS):
+        if key in self.INT_SETTINGS or key in self.FLOAT_SETTINGS:
+            conv = int if key in self.INT_SETTINGS else float
             try:
-                ret = int(ret)
+                ret = conv(ret)
             except ValueError:
-                logmsg = "Expected int for '%s': %s"
-                logmsg = logmsg % (key, ret)
+                logmsg = "Expected %s for '%s': %s"
+                logmsg = logmsg % (conv.__name__, key, ret)
                 self.logger.error(logmsg)
 
                 return defaults.SETTINGS[key]
@@ -85,100 +351,445 @@ class Engine:
 
         return ret
 
+    @property
+    def is_open(self):
+        return self._sess is not None
+
+    def open(self):
+        """
+        Setup the event loop and the HTTP session used by fetch.
+
+        While the engine is open all fetches share the same loop, connection
+        pool and cookie jar so connections to the same hosts are reused
+        between calls. Calling fetch on a closed engine opens and closes a
+        session just for that call.
+        """
+        if self.is_open:
+            return
+
+        self._loop = asyncio.new_event_loop()
+        self._sess = self._loop.run_until_complete(self._build_session())
+        self._scheduler = HostScheduler()
+
+        logmsg = "Session opened"
+        self.logger.debug(logmsg)
+
+    def close(self):
+        if not self.is_open:
+            return
+
+        # Shared requests may outlive their callers
+        pending = list(self._in_flight.values())
+        if pending:
+            for fut in pending:
+                fut.cancel()
+            self._loop.run_until_complete(
+                asyncio.gather(*pending, return_exceptions=True))
+        self._in_flight = {}
+
+        self._loop.run_until_complete(self._sess.close())
+        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        self._shutdown_executor()
+        self._loop.close()
+
+        self._sess = None
+        self._loop = None
+        self._scheduler = None
+
+        logmsg = "Session closed"
+        self.logger.debug(logmsg)
+
+    @contextlib.contextmanager
+    def _session_scope(self):
+        if self.is_open:
+            yield
+            return
+
+        self.open()
+        try:
+            yield
+        finally:
+            self.close()
+
+    async def _build_session(self):
+        ua = self.setting(defaults.KEY_SCRAPER_UA)
+        timeout = self.setting(defaults.KEY_SCRAPER_TIMEOUT)
+        keepalive = self.setting(defaults.KEY_SCRAPER_KEEPALIVE_TIMEOUT)
+
+        sess_opts = {
+            'connector': aiohttp.TCPConnector(keepalive_timeout=keepalive),
+            'cookie_jar': aiohttp.CookieJar(),
+            'headers': {
+                'User-Agent': ua
+            },
+            'timeout': aiohttp.ClientTimeout(total=timeout)
+        }
+
+        return aiohttp.ClientSession(**sess_opts)
+
     def process(self, *ctxs):
-        ctxs_and_buffers = self.fetch(*ctxs)
-        results = self.parse(*ctxs_and_buffers)
+        ret = []
+        for sources in self.process_iter(*ctxs):
+            ret.extend(sources)
 
-        return results
+        return ret
+
+    def process_iter(self, *ctxs):
+        """
+        Blocking wrapper over aprocess.
+
+        Yields a list of sources for each context as soon as its buffer has
+        been fetched and parsed. The event loop runs on a background thread
+        while the generator is alive, so requests in flight keep making
+        progress while callers work on early results.
+        """
+        with self._session_scope():
+            results = queue.Queue()
+
+            async def _pump():
+                agen = self.aprocess(*ctxs)
+                try:
+                    async for sources in agen:
+                        results.put((_BATCH, sources))
+
+                except Exception as e:
+                    results.put((_ERROR, e))
+
+                finally:
+                    await agen.aclose()
+                    results.put((_DONE, None))
+
+            def _run():
+                try:
+                    self._loop.run_until_complete(task)
+                except asyncio.CancelledError:
+                    pass
+
+            task = self._loop.create_task(_pump())
+            thread = threading.Thread(target=_run, daemon=True)
+            thread.start()
 
-    def fetch(self, *ctxs):
-        async def _task(acc, ctx, sess, sem):
             try:
-                content = self.srvs.cache.get(ctx.uri)
-            except cache.CacheKeyError:
-                content = None
+                while True:
+                    (kind, value) = results.get()
+                    if kind is _DONE:
+                        break
+
+                    if kind is _ERROR:
+                        raise value
+
+                    yield value
+
+            finally:
+                # Consumer may stop early, cancel remaining work
+                if not task.done():
+                    self._loop.call_soon_threadsafe(task.cancel)
+                thread.join()
+
+    async def aprocess(self, *ctxs):
+        executor = self._parse_executor()
+
+        async for (ctx, buffer) in self.afetch(*ctxs):
+            if executor:
+                items = await self._loop.run_in_executor(
+                    executor, _parse_job, type(ctx.provider), buffer,
+                    ctx.provider.html_backend)
+            else:
+                items = ctx.provider.parse(buffer)
 
-            if content:
-                logmsg = "URI '%s' found in cache, %s bytes"
-                logmsg = logmsg % (ctx.uri, len(content))
+            yield self._build_sources(ctx, items)
+
+    def fetch(self, *ctxs):
+        async def _collect():
+            return [x async for x in self.afetch(*ctxs)]
+
+        with self._session_scope():
+            return self._loop.run_until_complete(_collect())
+
+    async def afetch(self, *ctxs):
+        max_p_requests = self.setting(
+            defaults.KEY_SCRAPER_MAX_PARALEL_REQUESTS)
+        sem = asyncio.Semaphore(max_p_requests)
+
+        tasks = [asyncio.ensure_future(self._fetch_one(ctx, sem))
+                 for ctx in ctxs]
+
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+
+        finally:
+            # Consumer may stop early, don't leave requests behind
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _fetch_one(self, ctx, sem):
+        # Concurrent fetches for the same URI share a single request
+        try:
+            fut = self._in_flight[ctx.uri]
+
+        except KeyError:
+            fut = asyncio.ensure_future(self._fetch_uri(ctx, sem))
+            fut.add_done_callback(
+                lambda _: self._in_flight.pop(ctx.uri, None))
+            self._in_flight[ctx.uri] = fut
+
+        else:
+            logmsg = "URI '%s' already in flight, waiting for it"
+            logmsg = logmsg % ctx.uri
+            self.logger.debug(logmsg)
+
+        content = await asyncio.shield(fut)
+        return (ctx, content)
+
+    async def _fetch_uri(self, ctx, sem):
+        entry, fresh = self._cache_lookup(ctx.uri)
+        if fresh:
+            logmsg = "URI '%s' found in cache, %s bytes"
+            logmsg = logmsg % (ctx.uri, len(entry['body']))
+            self.logger.debug(logmsg)
+            return entry['body']
+
+        # Revalidate expired entries using the stored validators
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last-modified'):
+                headers['If-Modified-Since'] = entry['last-modified']
+
+        breaker = self.breaker(ctx.provider_name)
+        retries = self.setting(defaults.KEY_SCRAPER_RETRIES)
+        backoff = self.setting(defaults.KEY_SCRAPER_RETRY_BACKOFF)
+
+        for attempt in range(retries + 1):
+            probe = breaker.state == 'half-open'
+            if not breaker.allow():
+                logmsg = "Circuit open for provider '%s', skipping '%s'"
+                logmsg = logmsg % (ctx.provider_name, ctx.uri)
+                self.logger.warning(logmsg)
+                resp = None
+                break
+
+            try:
+                resp = await self._request(ctx, sem, headers)
+            except BaseException:
+                # Errors not handled by _request (cancellation, provider
+                # bugs...) never reach record(), let other probes through
+                if probe:
+                    breaker.release()
+                raise
+
+            failed = _is_failure(resp)
+            breaker.record(error=failed, probe=probe)
+            if not failed:
+                break
+
+            if attempt < retries:
+                # Exponential backoff with jitter
+                delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+                logmsg = "Retrying '%s' in %.2fs (%s/%s)"
+                logmsg = logmsg % (ctx.uri, delay, attempt + 1, retries)
                 self.logger.debug(logmsg)
-                acc.append((ctx, content))
-                return
 
-            async with sem:
-                try:
-                    logmsg = "Requesting '%s'..."
-                    logmsg = logmsg % ctx.uri
-                    self.logger.debug(logmsg)
-                    content = await ctx.provider.fetch(sess, ctx.uri)
-                except asyncio.TimeoutError:
-                    logmsg = "Timeout for '%s'"
-                    logmsg = logmsg % ctx.uri
-                    self.logger.warning(logmsg)
-                    content = ''
+                await asyncio.sleep(delay)
+
+        if _is_failure(resp):
+            resp = extensions.Response(status=0, headers={}, text='')
+
+        if resp.status == 304 and entry:
+            logmsg = "URI '%s' not modified, %s bytes from cache"
+            logmsg = logmsg % (ctx.uri, len(entry['body']))
+            self.logger.debug(logmsg)
+
+            self.srvs.cache.touch(ctx.uri)
+            return entry['body']
+
+        content = resp.text
+
+        logmsg = "URI '%s' fetched, %s bytes"
+        logmsg = logmsg % (ctx.uri, len(content))
+        self.logger.debug(logmsg)
+
+        if content and resp.status < 400:
+            logmsg = "URI '%s' saved to cache, %s bytes"
+            logmsg = logmsg % (ctx.uri, len(content))
+            self.logger.debug(logmsg)
 
-                logmsg = "URI '%s' fetched, %s bytes"
-                logmsg = logmsg % (ctx.uri, len(content))
+            self.srvs.cache.set(ctx.uri, {
+                'body': content,
+                'etag': resp.headers.get('ETag'),
+                'last-modified': resp.headers.get('Last-Modified')
+            })
+
+        return content
+
+    async def _request(self, ctx, sem, headers):
+        """
+        Do a single request for ctx.
+        Returns an extensions.Response or None on network errors.
+        """
+        limiter = self.limiter(ctx.provider_name)
+
+        async with self._scheduler.slot(ctx.provider, ctx.uri) as throttle, \
+                limiter.slot(), sem:
+            t0 = time.monotonic()
+            try:
+                await ctx.provider.prepare_fetch(self._sess, ctx.uri,
+                                                 throttle)
+
+                # Take the rate limit token last, right before sending
+                await throttle()
+                t0 = time.monotonic()
+
+                logmsg = "Requesting '%s'..."
+                logmsg = logmsg % ctx.uri
                 self.logger.debug(logmsg)
+                resp = await ctx.provider.fetch(self._sess, ctx.uri,
+                                                headers=headers or None)
 
-                if content:
-                    logmsg = "URI '%s' saved to cache, %s bytes"
-                    logmsg = logmsg % (ctx.uri, len(content))
-                    self.logger.debug(logmsg)
+            except asyncio.TimeoutError:
+                logmsg = "Timeout for '%s'"
+                logmsg = logmsg % ctx.uri
+                self.logger.warning(logmsg)
+                resp = None
+
+            except aiohttp.ClientError as e:
+                logmsg = "Error requesting '%s': %r"
+                logmsg = logmsg % (ctx.uri, e)
+                self.logger.warning(logmsg)
+                resp = None
+
+            # Providers are allowed to return just the body
+            if isinstance(resp, str):
+                resp = extensions.Response(status=200, headers={}, text=resp)
 
-                    self.srvs.cache.set(ctx.uri, content)
+            limiter.record(latency=time.monotonic() - t0,
+                           error=_is_failure(resp))
 
-                acc.append((ctx, content))
+        return resp
 
-        async def _wrapper(ctxs):
-            ua = self.setting(defaults.KEY_SCRAPER_UA)
-            timeout = self.setting(defaults.KEY_SCRAPER_TIMEOUT)
-            max_p_requests = self.setting(defaults.KEY_SCRAPER_MAX_PARALEL_REQUESTS)
+    def breaker(self, provider_name):
+        try:
+            return self._breakers[provider_name]
 
-            sess_opts = {
-                'cookie_jar': aiohttp.CookieJar(),
-                'headers': {
-                    'User-Agent': ua
-                },
-                'timeout': aiohttp.ClientTimeout(total=timeout)
-            }
+        except KeyError:
+            self._breakers[provider_name] = CircuitBreaker(
+                threshold=self.setting(
+                    defaults.KEY_SCRAPER_BREAKER_THRESHOLD),
+                cooldown=self.setting(
+                    defaults.KEY_SCRAPER_BREAKER_COOLDOWN))
 
-            ret = []
-            sem = asyncio.Semaphore(max_p_requests)
+            return self._breakers[provider_name]
 
-            async with aiohttp.ClientSession(**sess_opts) as sess:
-                tasks = [_task(ret, ctx, sess, sem) for ctx in ctxs]
-                await asyncio.gather(*tasks)
+    def limiter(self, provider_name):
+        """
+        Get the concurrency limiter for some provider.
+        Limiters are kept between sessions, use AdaptiveLimiter.stats to
+        inspect them.
+        """
+        try:
+            return self._limiters[provider_name]
 
-            return ret
+        except KeyError:
+            maximum = self.setting(defaults.KEY_SCRAPER_MAX_PARALEL_REQUESTS)
+            self._limiters[provider_name] = AdaptiveLimiter(
+                initial=min(2, maximum), maximum=maximum)
 
-        return asyncio.run(_wrapper(ctxs))
+            return self._limiters[provider_name]
+
+    @property
+    def limiters(self):
+        return dict(self._limiters)
+
+    def _cache_lookup(self, uri):
+        """
+        Returns a tuple (entry, fresh). entry is None if there is nothing
+        usable in cache.
+        """
+        try:
+            entry = _cache_entry(self.srvs.cache.get(uri))
+            return (entry, entry is not None)
+        except cache.CacheKeyExpiredError:
+            pass
+        except cache.CacheKeyError:
+            return (None, False)
+
+        try:
+            return (_cache_entry(self.srvs.cache.get(uri, stale=True)), False)
+        except cache.CacheKeyError:
+            return (None, False)
 
     def fetch_one(self, ctx):
         ctx, content = self.fetch(ctx)[0]
         return content
 
     def parse(self, *ctxs_and_buffers):
+        executor = self._parse_executor()
+
+        if executor:
+            try:
+                items = executor.map(
+                    _parse_job,
+                    [type(ctx.provider) for (ctx, _) in ctxs_and_buffers],
+                    [buffer for (_, buffer) in ctxs_and_buffers],
+                    [ctx.provider.html_backend
+                     for (ctx, _) in ctxs_and_buffers])
+                items = list(items)
+
+            finally:
+                # Executors are kept only while the engine is open
+                if not self.is_open:
+                    self._shutdown_executor()
+
+        else:
+            items = [ctx.provider.parse(buffer)
+                     for (ctx, buffer) in ctxs_and_buffers]
+
         ret = []
+        for ((ctx, _), ctxitems) in zip(ctxs_and_buffers, items):
+            ret.extend(self._build_sources(ctx, ctxitems))
 
-        for (ctx, buffer) in ctxs_and_buffers:
-            ctxitems = []
+        return ret
 
-            for item in ctx.provider.parse(buffer):
-                try:
-                    ctxitems.append(self._build_source(ctx, item))
-                except schema.ValidationError:
-                    logmsg = "Got invalid data from provider '%s', skipping."
-                    logmsg = logmsg % ctx.provider_name
-                    self.logger.warning(logmsg)
-                    break
+    def _parse_executor(self):
+        """
+        Process pool for provider.parse, None if parsing should be done in
+        the current process (parse.workers = 0).
+        """
+        workers = self.setting(defaults.KEY_SCRAPER_PARSE_WORKERS)
+        if workers <= 0:
+            return None
 
-            if not ctxitems:
-                logmsg = "Provider '%s' may be broken. Got 0 items from '%s'."
-                logmsg = logmsg % (ctx.provider_name, ctx.uri)
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers)
+
+        return self._executor
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _build_sources(self, ctx, items):
+        ret = []
+
+        for item in items:
+            try:
+                ret.append(self._build_source(ctx, item))
+            except schema.ValidationError:
+                logmsg = "Got invalid data from provider '%s', skipping."
+                logmsg = logmsg % ctx.provider_name
                 self.logger.warning(logmsg)
+                break
 
-            ret.extend(ctxitems)
+        if not ret:
+            logmsg = "Provider '%s' may be broken. Got 0 items from '%s'."
+            logmsg = logmsg % (ctx.provider_name, ctx.uri)
+            self.logger.warning(logmsg)
 
         return ret
 
@@ -212,14 +823,15 @@ class Engine:
             for name in self.srvs.loader.list('providers'):
                 cls = self.srvs.loader.get_class(name)
                 if cls.can_handle(uri):
-                    provider = cls()
+                    provider = self.srvs.loader.get_instance(name,
+                                                             self.srvs)
                     break
             else:
                 raise ProviderMissingError(uri)
 
         elif isinstance(provider, str):
-            provider = self.srvs.loader.get('providers.%s' % (provider),
-                                            self.srvs)
+            provider = self.srvs.loader.get_instance(
+                'providers.%s' % (provider), self.srvs)
 
         if not isinstance(provider, extensions.Provider):
             raise TypeError(provider)
@@ -229,19 +841,61 @@ class Engine:
         return Context(provider, uri, type=type, language=language)
 
     def build_n_contexts(self, n, *args, **kwargs):
-        def _expand(ctx, n):
-            g = ctx.provider.paginate(ctx.uri)
-            for _ in range(n):
-                try:
-                    uri = next(g)
-                except StopIteration:
+        ctx0 = self.build_context(*args, **kwargs)
+        return list(itertools.islice(self.paginate(ctx0), n))
+
+    def paginate(self, ctx):
+        for uri in ctx.provider.paginate(ctx.uri):
+            yield Context(provider=ctx.provider, uri=uri,
+                          type=ctx.type, language=ctx.language)
+
+    def process_incremental(self, n, *args, watermark=False, **kwargs):
+        """
+        Scrape up to n pages, one at a time and in order, stopping after the
+        first page containing only sources seen in previous incremental
+        runs. If watermark is True sources not newer than the last seen
+        'created' value are also considered as seen.
+
+        Pages that can't be fetched don't stop the scrape.
+        """
+        ctx0 = self.build_context(*args, **kwargs)
+        seen, mark = self.srvs.db.seen.get(ctx0.provider_name)
+        if not watermark:
+            mark = None
+
+        def _is_seen(src):
+            if src.id in seen:
+                return True
+
+            return (mark is not None and
+                    src.created is not None and
+                    src.created <= mark)
+
+        ret = []
+        with self._session_scope():
+            for ctx in itertools.islice(self.paginate(ctx0), n):
+                ((ctx, content),) = self.fetch(ctx)
+                if not content:
+                    logmsg = "Unable to fetch '%s', skipping page"
+                    logmsg = logmsg % ctx.uri
+                    self.logger.warning(logmsg)
+                    continue
+
+                sources = self.parse((ctx, content))
+                ret.extend(sources)
+
+                if all(_is_seen(x) for x in sources):
+                    logmsg = "No new sources in '%s', stop paginating"
+                    logmsg = logmsg % ctx.uri
+                    self.logger.debug(logmsg)
                     break
 
-                yield Context(provider=ctx.provider, uri=uri,
-                              type=ctx.type, language=ctx.language)
+        created = [x.created for x in ret if x.created is not None]
+        self.srvs.db.seen.update(ctx0.provider_name,
+                                 [x.id for x in ret],
+                                 max(created) if created else None)
 
-        ctx0 = self.build_context(*args, **kwargs)
-        return list(_expand(ctx0, n))
+        return ret
 
     def build_contexts_for_query(self, q):
         def _get_url(provider):
@@ -261,7 +915,7 @@ class Engine:
 
             return url
 
-        providers = [self.srvs.loader.get(x, self.srvs)
+        providers = [self.srvs.loader.get_instance(x, self.srvs)
                      for x in self.srvs.loader.list('providers')]
         prov_and_uris = [(x, _get_url(x)) for x in providers]
         prov_and_uris = [(p, u) for (p, u) in prov_and_uris if u]
@@ -272,5 +926,35 @@ class Engine:
         return ctxs
 
 
+# Messages from the event loop thread to process_iter
+_BATCH = 'batch'
+_DONE = 'done'
+_ERROR = 'error'
+
+
+def _parse_job(provider_cls, buffer, html_backend):
+    # Runs on parse workers. Providers get their own services instance, they
+    # should not depend on app state to parse.
+    srvs = Services()
+    srvs.settings.set(defaults.KEY_SCRAPER_HTML_BACKEND, html_backend)
+
+    return provider_cls(srvs).parse(buffer)
+
+
+def _is_failure(resp):
+    return resp is None or resp.status == 429 or resp.status >= 500
+
+
+def _cache_entry(value):
+    # Older cache entries only have the body
+    if isinstance(value, str):
+        value = {'body': value}
+
+    if not value or not value.get('body'):
+        return None
+
+    return value
+
+
 class ProviderMissingError(Exception):
     pass
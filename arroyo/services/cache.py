@@ -94,13 +94,40 @@ class BaseCache:
         return value
 
     @abc.abstractmethod
-    def get(self, key):
+    def get(self, key, stale=False):
+        """
+        Get value for key.
+        Expired values raise CacheKeyExpiredError unless stale is True, in
+        that case they are returned anyway (i.e. for revalidation)
+        """
         raise NotImplementedError()
 
+    def get_many(self, keys, stale=False):
+        """
+        Get values for several keys at once.
+        Returns a dict with the keys found, missing and expired keys are
+        omitted.
+        """
+        ret = {}
+        for key in keys:
+            try:
+                ret[key] = self.get(key, stale=stale)
+            except CacheKeyError:
+                pass
+
+        return ret
+
     @abc.abstractmethod
     def set(self, key, value):
         raise NotImplementedError()
 
+    @abc.abstractmethod
+    def touch(self, key):
+        """
+        Refresh timestamp for key without changing its value
+        """
+        raise NotImplementedError()
+
     @abc.abstractmethod
     def delete(self, key):
         raise NotImplementedError()
@@ -111,27 +138,32 @@ class BaseCache:
 
 
 class NullCache(BaseCache):
-    def get(self, key):
+    def get(self, key, stale=False):
         raise CacheKeyMissError(key)
 
+    def get_many(self, keys, stale=False):
+        return {}
+
     def set(self, key, data):
         pass
 
+    def touch(self, key):
+        pass
+
 
 class MemoryCache(BaseCache):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._mem = {}
 
-    def get(self, key):
+    def get(self, key, stale=False):
         if key not in self._mem:
             raise CacheKeyMissError(key)
 
         ts, value = self._mem[key]
         now = _now()
 
-        if now - ts > self.delta:
-            del(self._mem[key])
+        if now - ts > self.delta and not stale:
             raise CacheKeyExpiredError(key)
 
         return value
@@ -139,6 +171,14 @@ class MemoryCache(BaseCache):
     def set(self, key, value):
         self._mem[key] = (_now(), value)
 
+    def touch(self, key):
+        try:
+            ts, value = self._mem[key]
+        except KeyError as e:
+            raise CacheKeyMissError(key) from e
+
+        self._mem[key] = (_now(), value)
+
     def delete(self, key):
         try:
             del(self._mem[key])
@@ -191,14 +231,24 @@ class DiskCache(BaseCache):
         return self._path_is_expired(p)
 
     def _path_is_expired(self, p):
-        return _now() - p.stat().st_ctime > self.delta
+        return _now() - p.stat().st_mtime > self.delta
 
     def set(self, key, value):
         p = pathlib.Path(self.encode_key(key))
         p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_bytes(self.encode_value(value))
 
-    def get(self, key):
+        # Write and rename so readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=str(p.parent), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(self.encode_value(value))
+            os.replace(tmp, str(p))
+
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, key, stale=False):
         p = pathlib.Path(self.encode_key(key))
 
         try:
@@ -207,14 +257,15 @@ class DiskCache(BaseCache):
         except (OSError, IOError) as e:
             raise CacheKeyMissError(key) from e
 
-        if expired:
-            self.delete(key)
+        # Expired entries are kept on disk so they can be revalidated, purge
+        # takes care of them
+        if expired and not stale:
             raise CacheKeyExpiredError(key)
 
         try:
             return self.decode_value(p.read_bytes())
 
-        except EOFError as e:
+        except (EOFError, pickle.UnpicklingError) as e:
             self.delete(key)
             raise CacheKeyError(key) from e
 
@@ -224,6 +275,18 @@ class DiskCache(BaseCache):
         except OSError as e:
             raise CacheOSError() from e
 
+    def touch(self, key):
+        p = pathlib.Path(self.encode_key(key))
+        try:
+            now = _now()
+            os.utime(str(p), (now, now))
+
+        except FileNotFoundError as e:
+            raise CacheKeyMissError(key) from e
+
+        except OSError as e:
+            raise CacheOSError() from e
+
     def delete(self, key):
         p = pathlib.Path(self.encode_key(key))
         try:
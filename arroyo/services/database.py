@@ -29,6 +29,7 @@ class Database:
             'downloads': {}
         }
         self.downloads = _Downloads(self)
+        self.seen = _Seen(self)
 
     def commit(self):
         self._storage.write(self.data)
@@ -43,6 +44,8 @@ class _Downloads:
     def __init__(self, db):
         self.db = db
         self.data = db.data
+        # Index of entities with downloads, built on demand
+        self._entities = None
 
     def add(self, src, external, state=0, entity=None):
         if src.id in self.data['downloads']:
@@ -50,6 +53,7 @@ class _Downloads:
 
         row = [src.dict(), external, state, entity.dict() if entity else {}]
         self.data['downloads'][src.id] = row
+        self._entities = None
         self.db.commit()
 
     def delete(self, src):
@@ -57,8 +61,21 @@ class _Downloads:
             del(self.data['downloads'][src.id])
         except KeyError as e:
             raise NotFoundError() from e
+        self._entities = None
         self.db.commit()
 
+    def has_entity(self, entity):
+        """
+        Check if there is any download for entity.
+        Equivalent to bool(sources_for_entity(entity)) but O(1).
+        """
+        if self._entities is None:
+            self._entities = set(
+                _entity_key(row[self.ENTITY])
+                for row in self.data['downloads'].values())
+
+        return _entity_key(entity.dict()) in self._entities
+
     def set_state(self, src, state):
         try:
             self.data['downloads'][src.id][self.STATE] = state
@@ -73,7 +90,8 @@ class _Downloads:
             raise NotFoundError() from e
 
     def all_states(self):
-        yield from ((schema.Source(**row[self.SOURCE]), row[self.STATE])
+        yield from ((schema.Source.from_trusted(row[self.SOURCE]),
+                     row[self.STATE])
                     for row in self.data['downloads'].values())
 
     def external_for_source(self, src):
@@ -85,12 +103,12 @@ class _Downloads:
     def source_for_external(self, external):
         row = self._find_one(self.EXTERNAL, external)
         srcdata = row[self.SOURCE]
-        return schema.Source(**srcdata)
+        return schema.Source.from_trusted(srcdata)
 
     def sources_for_entity(self, entity):
         entity = entity.dict()
         return [
-            schema.Source(**row[self.SOURCE])
+            schema.Source.from_trusted(row[self.SOURCE])
             for row in self._find(self.ENTITY, entity)]
 
     def _find(self, column, value):
@@ -112,6 +130,46 @@ class _Downloads:
         return res[0]
 
 
+def _entity_key(data):
+    return tuple(sorted(data.items()))
+
+
+class _Seen:
+    """
+    Index of source ids already scraped from each provider, used for
+    incremental scrapes. Only the most recent MAX_IDS ids are kept.
+    """
+    MAX_IDS = 5000
+
+    def __init__(self, db):
+        self.db = db
+        self.data = db.data.setdefault('seen', {})
+
+    def get(self, provider):
+        """
+        Returns a tuple (set of ids, watermark). watermark is the newest
+        known 'created' value or None
+        """
+        try:
+            row = self.data[provider]
+        except KeyError:
+            return (set(), None)
+
+        return (set(row['ids']), row['watermark'])
+
+    def update(self, provider, ids, watermark=None):
+        row = self.data.setdefault(provider, {'ids': [], 'watermark': None})
+
+        known = set(row['ids'])
+        row['ids'].extend([x for x in ids if x not in known])
+        row['ids'] = row['ids'][-self.MAX_IDS:]
+
+        if watermark is not None:
+            row['watermark'] = max(watermark, row['watermark'] or watermark)
+
+        self.db.commit()
+
+
 class IntegrityError(Exception):
     pass
 
@@ -19,11 +19,18 @@
 
 
 import importlib
+import weakref
 
 
 class ClassLoader:
     def __init__(self, defs=None):
         self._reg = {}
+        # Scopes with cached instances. Instances are stored on the scope
+        # itself (see _scope_instances)
+        self._scopes = weakref.WeakSet()
+        # Incremented on each change to the registry, allows users to detect
+        # changes and rebuild anything derived from it
+        self.version = 0
         if defs:
             for (name, cls) in defs.items():
                 self.register(name, cls)
@@ -40,10 +47,57 @@ class ClassLoader:
 
     def register(self, name, target):
         self._reg[name] = target
+        self.invalidate(name)
+        self.version += 1
 
     def get(self, name, *args, **kwargs):
         return self.get_class(name)(*args, **kwargs)
 
+    def get_instance(self, name, scope, *args, **kwargs):
+        """
+        Like get(name, scope, *args, **kwargs) but the instance is cached per
+        scope (usually a Services object) and reused in later calls.
+        Extra arguments are only used when the instance is created.
+        """
+        instances = self._scope_instances(scope)
+        try:
+            return instances[name]
+        except KeyError:
+            pass
+
+        instance = self.get(name, scope, *args, **kwargs)
+        instances[name] = instance
+        self._scopes.add(scope)
+
+        return instance
+
+    def _scope_instances(self, scope):
+        # Instances usually hold a reference to their scope, keeping them
+        # in the loader (even in a weak mapping) would keep scopes alive
+        # forever. They live in the scope instead, keyed by loader.
+        try:
+            cache = scope._loader_instances
+        except AttributeError:
+            cache = scope._loader_instances = weakref.WeakKeyDictionary()
+
+        return cache.setdefault(self, {})
+
+    def invalidate(self, name=None, scope=None):
+        """
+        Drop cached instances for name (all if None) in scope (all scopes if
+        None)
+        """
+        if scope is None:
+            scopes = list(self._scopes)
+        else:
+            scopes = [scope]
+
+        for instances in [self._scope_instances(x) for x in scopes]:
+            if name is None:
+                instances.clear()
+            else:
+                instances.pop(name, None)
+
     def get_class(self, name):
         try:
             cls = self._reg[name]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Compare distributor extraction: the old per-distributor find loop against
+# the compiled alternation used by analyze.strip_distributors
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_distributors.py \
+#       [n_names] [n_distributors]
+
+
+import itertools
+import random
+import sys
+import timeit
+
+
+from arroyo import analyze
+
+
+def loop_strip_distributors(name, distributors):
+    release_distributors = set()
+    for dist in distributors:
+        tag = '[' + dist + ']'
+        idx = name.lower().find(tag)
+        if idx == -1:
+            continue
+
+        name = (name[:idx] + name[idx+len(tag):]).strip()
+        release_distributors.add(dist)
+
+    return name, release_distributors
+
+
+def build_corpus(n, distributors):
+    rnd = random.Random(0)
+    titles = ['The.Walking.Dead', 'Doctor.Who', 'Mr.Robot', 'Dark',
+              'Some.Movie.Title']
+    releases = ['S01E02.720p.HDTV.x264-GRP', '2019.1080p.WEB.h264-GRP',
+                'S10E22.480p.x264-mSD']
+
+    ret = []
+    for (title, release) in itertools.islice(
+            itertools.cycle(itertools.product(titles, releases)), n):
+        name = title + '.' + release
+        # Half of the names have some distributor tag
+        if rnd.random() < 0.5:
+            name += '[' + rnd.choice(distributors) + ']'
+
+        ret.append(name)
+
+    return ret
+
+
+def main(n_names=100000, n_distributors=len(analyze.KNOWN_DISTRIBUTORS)):
+    distributors = list(analyze.KNOWN_DISTRIBUTORS)
+    distributors += ['dist%d' % i
+                     for i in range(n_distributors - len(distributors))]
+    analyze.set_distributors(distributors)
+
+    corpus = build_corpus(n_names, distributors)
+
+    t_loop = timeit.timeit(
+        lambda: [loop_strip_distributors(x, distributors) for x in corpus],
+        number=1)
+    t_re = timeit.timeit(
+        lambda: [analyze.strip_distributors(x) for x in corpus],
+        number=1)
+
+    print("%d names, %d distributors" % (n_names, len(distributors)))
+    print("%-8s %10.2f ms" % ('loop', t_loop * 1000))
+    print("%-8s %10.2f ms" % ('regex', t_re * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Group sources by entity (like query.Engine.sort does) with cached entity
+# identity against the previous uncached hash/id computations
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_entity.py [n_sources]
+
+
+import hashlib
+import sys
+import timeit
+
+
+from arroyo import schema
+
+
+def uncached_hash(entity):
+    return hash((entity.series.lower(),
+                 entity.year,
+                 entity.season,
+                 entity.number,
+                 (entity.country or '').lower()))
+
+
+def uncached_id(entity):
+    dig = hashlib.sha1()
+    s = '\0'.join([
+        entity.type,
+        entity.series,
+        str(entity.year or ''),
+        str(entity.season),
+        str(entity.number),
+        entity.country or '',
+    ])
+    dig.update(s.encode('utf-8'))
+    return dig.hexdigest()
+
+
+def build_entities(n):
+    # ~10 sources per entity, entities are shared like the analyzer does
+    # for sources with the same name
+    entities = [
+        schema.Episode(type='episode', series='Series %d' % (i // 100),
+                       season=1, number=i % 100)
+        for i in range(max(1, n // 10))]
+
+    return [entities[i % len(entities)] for i in range(n)]
+
+
+def group(entities, keyfn, idfn):
+    groups = {}
+    for entity in entities:
+        groups.setdefault(keyfn(entity), []).append(idfn(entity))
+
+    return groups
+
+
+def main(n=100000, rounds=5):
+    entities = build_entities(n)
+
+    t_uncached = timeit.timeit(
+        lambda: group(entities, uncached_hash, uncached_id),
+        number=rounds)
+    t_cached = timeit.timeit(
+        lambda: group(entities, hash, lambda x: x.id),
+        number=rounds)
+
+    print("%d sources, %d rounds" % (n, rounds))
+    print("%-10s %10.2f ms/round" % ('uncached', t_uncached * 1000 / rounds))
+    print("%-10s %10.2f ms/round" % ('cached', t_cached * 1000 / rounds))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
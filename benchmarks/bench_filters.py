@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Compare per-item comparison functions (cmp_like, cmp_glob, cmp_in) against
+# the matchers precompiled by compile_cmp over a large set of sources
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_filters.py [n_sources]
+
+
+import sys
+import timeit
+
+
+from arroyo import schema
+from arroyo.plugins.filters import generic
+
+
+FILTERS = [
+    ('name-like', r'.*S0[1-3]E\d+.*720p'),
+    ('name-glob', '*S01E0?*1080p*'),
+    ('provider-in', 'eztv, thepiratebay, torrentapi'),
+]
+
+
+def build_sources(n):
+    providers = ['eztv', 'thepiratebay', 'torrentapi', 'epublibre']
+    qualities = ['480p', '720p', '1080p']
+
+    return [
+        schema.Source.from_trusted({
+            'name': 'Series.%d.S%02dE%02d.%s.WEB.x264-GRP' % (
+                i % 1000, i % 5, i % 20, qualities[i % 3]),
+            'provider': providers[i % 4],
+            'uri': 'magnet:?xt=urn:btih:%040x' % i,
+        })
+        for i in range(n)]
+
+
+def main(n=100000):
+    sources = build_sources(n)
+
+    print("%d sources" % n)
+    print("%-14s %12s %12s" % ('filter', 'per-item ms', 'compiled ms'))
+    for (name, value) in FILTERS:
+        basename, fn = generic.eval_filter_name(name)
+
+        def _per_item():
+            return [x for x in sources
+                    if fn(value, getattr(x, basename))]
+
+        def _compiled():
+            cmp = generic.compile_cmp(fn, value)
+            return [x for x in sources if cmp(getattr(x, basename))]
+
+        assert _per_item() == _compiled()
+
+        t_per_item = timeit.timeit(_per_item, number=1)
+        t_compiled = timeit.timeit(_compiled, number=1)
+        print("%-14s %12.2f %12.2f" % (name, t_per_item * 1000,
+                                       t_compiled * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
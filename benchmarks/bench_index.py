@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Compare linear scans against index lookups (query.CollectionIndex and,
+# if numpy is available, query.ColumnarIndex) for a set of queries over the
+# same collection
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_index.py [n_sources]
+
+
+import sys
+import time
+
+
+from arroyo import (
+    defaults,
+    query,
+    schema
+)
+from arroyo.services import (
+    ClassLoader,
+    Services
+)
+
+
+QUERIES = [
+    dict(series='series 42', state='all'),
+    dict(series='series 7', season=2, quality='720p', state='all'),
+    dict(type='movie', movie_year_min=2015, state='all'),
+    dict(seeds_min=9900, type='episode', state='all'),
+    dict(provider_in='eztv, torrentapi', size_max=1000, state='all'),
+    dict(seeds_min=1000, size_max=90000, state='all'),
+    dict(created_min=1000, seeds_max=5000, state='all'),
+]
+
+
+def build_sources(n):
+    providers = ['eztv', 'thepiratebay', 'torrentapi', 'epublibre']
+    qualities = ['480p', '720p', '1080p']
+
+    ret = []
+    for i in range(n):
+        if i % 10:
+            entity = {'type': 'episode', 'series': 'Series %d' % (i % 1000),
+                      'season': i % 5, 'number': i % 20}
+        else:
+            entity = {'type': 'movie', 'title': 'Movie %d' % i,
+                      'year': 1990 + i % 35}
+
+        ret.append(schema.Source.from_trusted({
+            'name': 'Source %d' % i,
+            'provider': providers[i % 4],
+            'uri': 'magnet:?xt=urn:btih:%040x' % i,
+            'seeds': i % 10000,
+            'size': i % 100000,
+            'created': i,
+            'entity': entity,
+            'metadata': {'video.screen-size': qualities[i % 3]},
+        }))
+
+    return ret
+
+
+def main(n=100000):
+    engine = query.Engine(Services(loader=ClassLoader(defaults.PLUGINS)))
+    sources = build_sources(n)
+    plans = [engine.build_filter_context(query.Query(**q))
+             for q in QUERIES]
+
+    t0 = time.perf_counter()
+    scanned = [plan.apply(sources) for plan in plans]
+    t_scan = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = engine.build_index(sources)
+    indexed = [plan.apply(sources, index=index) for plan in plans]
+    t_index = time.perf_counter() - t0
+
+    assert scanned == indexed
+
+    t0 = time.perf_counter()
+    for plan in plans:
+        plan.apply(sources, index=index)
+    t_reuse = time.perf_counter() - t0
+
+    print("%d sources, %d queries" % (n, len(plans)))
+    print("%-30s %10.2f ms" % ('scan', t_scan * 1000))
+    print("%-30s %10.2f ms" % ('index (build + lookup)', t_index * 1000))
+    print("%-30s %10.2f ms" % ('index (reused)', t_reuse * 1000))
+
+    if not query._has_numpy:
+        print("numpy not available, skipping columnar index")
+        return
+
+    t0 = time.perf_counter()
+    index = engine.build_index(sources, columnar=True)
+    columnar = [plan.apply(sources, index=index) for plan in plans]
+    t_columnar = time.perf_counter() - t0
+
+    assert scanned == columnar
+
+    t0 = time.perf_counter()
+    for plan in plans:
+        plan.apply(sources, index=index)
+    t_reuse = time.perf_counter() - t0
+
+    print("%-30s %10.2f ms" % ('columnar (build + lookup)',
+                               t_columnar * 1000))
+    print("%-30s %10.2f ms" % ('columnar (reused)', t_reuse * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Compare HTML backends for provider.parse over tests/samples
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_parse.py [rounds]
+
+
+import os
+import sys
+import timeit
+
+
+from arroyo import (
+    defaults,
+    extensions
+)
+from arroyo.services import Services
+from arroyo.plugins.providers.eztv import EzTV
+from arroyo.plugins.providers.thepiratebay import ThePirateBay
+
+
+SAMPLES_DIR = (os.path.dirname(os.path.realpath(__file__)) +
+               '/../tests/samples')
+SAMPLES = [
+    (EzTV, 'eztv.html'),
+    (EzTV, 'eztv-listing.html'),
+    (ThePirateBay, 'thepiratebay-general.html'),
+    (ThePirateBay, 'thepiratebay-movies.html'),
+    (ThePirateBay, 'thepiratebay-series.html'),
+]
+
+
+def main(rounds=20):
+    backends = ['html.parser']
+    if extensions._has_lxml:
+        backends.extend(['lxml', 'lxml-tree'])
+
+    print("%-28s %-12s %10s" % ('sample', 'backend', 'ms/parse'))
+    for (cls, sample) in SAMPLES:
+        with open(SAMPLES_DIR + '/' + sample, encoding='utf-8') as fh:
+            buffer = fh.read()
+
+        for backend in backends:
+            srvs = Services()
+            srvs.settings.set(defaults.KEY_SCRAPER_HTML_BACKEND, backend)
+            provider = cls(srvs)
+
+            t = timeit.timeit(lambda: provider.parse(buffer), number=rounds)
+            print("%-28s %-12s %10.2f" % (sample, backend,
+                                          t * 1000 / rounds))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -18,11 +18,18 @@
 # USA.
 
 
+import itertools
+import json
+import os
 import unittest
+import weakref
+from unittest import mock
 
 
+from arroyo import analyze as analyzemod
 from arroyo.analyze import analyze
 from arroyo.schema import Movie
+from arroyo.services import cache
 
 
 from testlib import build_source
@@ -38,5 +45,303 @@ class TestAnalyze(unittest.TestCase):
         self.assertTrue(isinstance(asrc.entity, Movie))
 
 
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.parse_cache = analyzemod.ParseCache(maxsize=2)
+        patcher = mock.patch.object(analyzemod, 'parse_cache',
+                                    self.parse_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_names_skip_guessit(self):
+        # No release group, not handled by fast_parse
+        name = 'Foo.S01E02.720p.HDTV.x264'
+        with mock.patch('guessit.guessit',
+                        wraps=analyzemod.guessit.guessit) as m:
+            e1, _, _ = analyzemod.parse(name)
+            e2, _, _ = analyzemod.parse(name)
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(e1, e2)
+        self.assertEqual(self.parse_cache.stats()['hits'], 1)
+        self.assertEqual(self.parse_cache.stats()['misses'], 1)
+
+    def test_type_hint_is_part_of_the_key(self):
+        analyzemod.parse('Foo 2019', type_hint='movie')
+        analyzemod.parse('Foo 2019', type_hint='episode')
+
+        self.assertEqual(self.parse_cache.stats()['misses'], 2)
+
+    def test_lru_eviction(self):
+        for name in ['a', 'b', 'c']:
+            self.parse_cache.set(name, None, {'title': name})
+
+        with self.assertRaises(cache.CacheKeyMissError):
+            self.parse_cache.get('a')
+
+        self.assertEqual(self.parse_cache.get('c'), {'title': 'c'})
+
+    def test_returned_values_are_copies(self):
+        self.parse_cache.set('a', None, {'title': 'a'})
+        self.parse_cache.get('a').pop('title')
+
+        self.assertEqual(self.parse_cache.get('a'), {'title': 'a'})
+
+    def test_persistent_tier(self):
+        persistent = cache.MemoryCache(delta=-1)
+        self.parse_cache.persistent = persistent
+        self.parse_cache.set('a', None, {'title': 'a'})
+
+        other = analyzemod.ParseCache(persistent=persistent)
+        self.assertEqual(other.get('a'), {'title': 'a'})
+        self.assertEqual(other.stats()['hits'], 1)
+
+
+class TestAnalyzer(unittest.TestCase):
+    NAMES = ['Series.S01E%02d.720p.HDTV.x264-GRP' % i for i in range(1, 13)]
+
+    def setUp(self):
+        self.analyzer = analyzemod.Analyzer(processes=2, min_batch=4)
+        self.addCleanup(self.analyzer.close)
+
+    def test_pool_is_reused(self):
+        # Only names going to guessit are sent to the pool
+        srcs = [build_source(x.replace('-GRP', '')) for x in self.NAMES]
+
+        with mock.patch.object(analyzemod, 'parse_cache',
+                               analyzemod.ParseCache(maxsize=0)):
+            self.analyzer.analyze(*srcs)
+            pool = self.analyzer._pool
+            self.analyzer.analyze(*srcs)
+
+        self.assertTrue(pool is not None)
+        self.assertTrue(self.analyzer._pool is pool)
+
+    def test_pool_is_not_forked(self):
+        # Pool can be started while the scraper thread is running
+        with self.analyzer:
+            ctx = self.analyzer.pool._ctx
+
+        self.assertNotEqual(ctx.get_start_method(), 'fork')
+
+    def test_mp_keeps_order(self):
+        srcs = [build_source(x) for x in self.NAMES]
+        ret = self.analyzer.analyze(*srcs)
+
+        self.assertEqual([x.name for x in ret], self.NAMES)
+        self.assertEqual([x.entity.number for x in ret], list(range(1, 13)))
+
+    def test_analyze_iter(self):
+        srcs = [build_source(x) for x in self.NAMES]
+        ret = list(self.analyzer.analyze_iter(*srcs))
+
+        self.assertEqual(set(x.name for x in ret), set(self.NAMES))
+
+    def test_duplicated_names_are_parsed_once(self):
+        name = self.NAMES[0]
+        srcs = [build_source(name, uri='magnet:?xt=urn:btih:%s' % i)
+                for i in range(3)]
+
+        with mock.patch('arroyo.analyze.normalize',
+                        wraps=analyzemod.normalize) as m:
+            ret = self.analyzer.analyze(*srcs, mp=False)
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual([x.id for x in ret], ['0', '1', '2'])
+        self.assertTrue(all(x.entity.number == 1 for x in ret))
+
+    def test_type_hint_splits_duplicated_names(self):
+        name = 'Foo 2019'
+        srcs = [build_source(name, uri='magnet:?xt=urn:btih:1',
+                             hints={'type': 'movie'}),
+                build_source(name, uri='magnet:?xt=urn:btih:2',
+                             hints={'type': 'episode'})]
+
+        with mock.patch('arroyo.analyze.normalize',
+                        wraps=analyzemod.normalize) as m:
+            self.analyzer.analyze(*srcs, mp=False)
+
+        self.assertEqual(m.call_count, 2)
+
+    def test_store_skips_known_sources(self):
+        self.analyzer.store = cache.MemoryCache(delta=-1)
+        srcs = [build_source(x) for x in self.NAMES[:3]]
+        self.analyzer.analyze(*srcs, mp=False)
+
+        with mock.patch('arroyo.analyze.normalize',
+                        wraps=analyzemod.normalize) as m:
+            srcs.append(build_source(self.NAMES[3]))
+            ret = self.analyzer.analyze(*srcs, mp=False)
+            ret_iter = list(self.analyzer.analyze_iter(*srcs, mp=False))
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual([x.name for x in ret], self.NAMES[:4])
+        self.assertEqual([x.entity.number for x in ret], [1, 2, 3, 4])
+        self.assertEqual(set(x.name for x in ret_iter), set(self.NAMES[:4]))
+
+    def test_store_depends_on_distributors(self):
+        self.addCleanup(analyzemod.set_distributors,
+                        analyzemod.get_distributors())
+
+        self.analyzer.store = cache.MemoryCache(delta=-1)
+        srcs = [build_source(x + '[foo]') for x in self.NAMES[:2]]
+        ret = self.analyzer.analyze(*srcs, mp=False)
+        self.assertEqual(ret[0].metadata.get(
+            analyzemod.Tags.RELEASE_DISTRIBUTORS), None)
+
+        # Stored results are outdated once distributors change
+        analyzemod.set_distributors(
+            analyzemod.KNOWN_DISTRIBUTORS + ['foo'])
+        ret = self.analyzer.analyze(*srcs, mp=False)
+        self.assertEqual(
+            ret[0].metadata[analyzemod.Tags.RELEASE_DISTRIBUTORS], ['foo'])
+
+    def test_parse_cache_is_used_with_mp(self):
+        # No release group, not handled by fast_parse
+        names = ['Series.S01E%02d.720p.HDTV.x264' % i for i in range(1, 9)]
+        srcs = [build_source(x) for x in names]
+        parse_cache = analyzemod.ParseCache()
+
+        with mock.patch.object(analyzemod, 'parse_cache', parse_cache):
+            self.analyzer.analyze(*srcs)
+            self.assertTrue(self.analyzer._pool is not None)
+            self.assertEqual(parse_cache.stats()['misses'], 8)
+            self.assertEqual(parse_cache.stats()['size'], 8)
+
+            # Everything is cached now, nothing goes to the workers
+            with mock.patch.object(analyzemod, '_guessit_job') as m:
+                ret = self.analyzer.analyze(*srcs)
+
+            self.assertEqual(m.call_count, 0)
+            self.assertEqual(parse_cache.stats()['hits'], 8)
+            self.assertEqual([x.entity.number for x in ret],
+                             list(range(1, 9)))
+
+    def test_analyzers_are_not_kept_alive(self):
+        analyzer = analyzemod.Analyzer(processes=1)
+        self.assertTrue(analyzer in analyzemod._analyzers)
+
+        ref = weakref.ref(analyzer)
+        del analyzer
+        self.assertTrue(ref() is None)
+
+    def test_small_batches_dont_start_the_pool(self):
+        srcs = [build_source(x) for x in self.NAMES[:2]]
+        ret = self.analyzer.analyze(*srcs)
+
+        self.assertEqual(len(ret), 2)
+        self.assertTrue(self.analyzer._pool is None)
+
+
+class TestDistributors(unittest.TestCase):
+    def setUp(self):
+        distributors = analyzemod.get_distributors()
+        self.addCleanup(analyzemod.set_distributors, distributors)
+
+    def test_strip(self):
+        self.assertEqual(
+            analyzemod.strip_distributors('Foo.S01E01-GRP[eztv].mkv[EZTV]'),
+            ('Foo.S01E01-GRP.mkv', {'eztv'}))
+        self.assertEqual(
+            analyzemod.strip_distributors('Foo [ettv] [rartv]'),
+            ('Foo', {'ettv', 'rartv'}))
+        self.assertEqual(
+            analyzemod.strip_distributors('Foo [bar]'),
+            ('Foo [bar]', set()))
+
+    def test_extra_distributors(self):
+        analyzemod.set_distributors(analyzemod.KNOWN_DISTRIBUTORS + ['bar'])
+        self.assertEqual(
+            analyzemod.strip_distributors('Foo [bar]'),
+            ('Foo', {'bar'}))
+
+
+class TestFastParse(unittest.TestCase):
+    SAMPLES_DIR = os.path.dirname(os.path.realpath(__file__)) + '/samples'
+
+    TITLES = [
+        'The.Walking.Dead', 'Doctor.Who', 'Mr.Robot', 'This.Is.Us',
+        'Its.Always.Sunny.in.Philadelphia', 'Dark', 'lone.star.law',
+        'Dune.Part.Two', 'Us', 'Se', 'Spanish.Princess', 'The.Office.US',
+        'Helicopter.ER', 'Hawaii.Five-0', 'Magnum.P.I',
+        'Movie.Unrated', 'Bluray', 'Catalan', 'Flemish', 'Greek.Myths',
+        'The.Remastered.Cut', 'Extended.Family', 'Castellano', 'Swedish',
+        'Brazilian.Wax', 'Netflix.Nation', 'Dubbed.Love', 'Xvid.Files',
+        'Australia', 'Ultimate.Heroes', 'Theatrical.Nights',
+    ]
+    RELEASES = [
+        '.S01E02.720p.HDTV.x264-KILLERS',
+        '.S05E10.1080p.WEB.h264-TBS',
+        '.S03E01.720p.WEBRip.x264-ION10',
+        '.S01E01.1080p.AMZN.WEB-DL.DDP5.1.H.264-NTb',
+        '.2019.S01E05.720p.HDTV.x264-AVS',
+        '.S10E22.480p.x264-mSD.mkv',
+        '.S04E08.REPACK.1080p.WEB.H264-GGEZ',
+        '.S01E09.2160p.HMAX.WEB-DL.DD5.1.H.265-NTb',
+        '.S01E03.720p.HULU.WEBRip.AAC2.0.x264-TEPES',
+        '.2019.1080p.BluRay.x264-SPARKS',
+        '.2018.720p.WEBRip.AAC2.0.x264-GRP',
+        '.S01E02.iNTERNAL.720p.WEB.h264-GRP',
+        '.S01E02E03.720p.HDTV.x264-GRP',
+    ]
+
+    def corpus(self):
+        for sample in ['eztv-parsed.json', 'torrentapi-parsed.json']:
+            with open(self.SAMPLES_DIR + '/' + sample) as fh:
+                for item in json.load(fh):
+                    yield analyzemod.strip_distributors(item['name'])[0]
+
+        for (title, release) in itertools.product(self.TITLES,
+                                                  self.RELEASES):
+            yield title + release
+            yield title.lower() + release.lower()
+            yield (title + release).replace('.', ' ', title.count('.') + 1)
+
+    def test_agrees_with_guessit(self):
+        fast = 0
+        for name in self.corpus():
+            parsed = analyzemod.fast_parse(name)
+            if parsed is None:
+                continue
+
+            fast += 1
+            expected = dict(analyzemod.guessit.guessit(name))
+            self.assertEqual(parsed, expected, msg=name)
+
+        # Make sure the fast path is actually used
+        self.assertTrue(fast > 100)
+
+    def test_unsupported_layouts(self):
+        names = [
+            'Series.S01E02E03.720p.HDTV.x264-GRP',
+            'Series.S01E02.720p.HDTV.x264',
+            'Series.S01E02.720p.FOO.x264-GRP',
+            'Series.S01E02.720p.WEB.HDTV.x264-GRP',
+            'Series.US.S01E02.720p.HDTV.x264-GRP',
+            'Series.French.S01E02.720p.HDTV.x264-GRP',
+            'Series Name.S01E02.720p.HDTV.x264-GRP',
+            'Movie.Name.1080p.BluRay.x264-GRP',
+            'Movie.Unrated.2019.1080p.BluRay.x264-GRP',
+            'Bluray.S01E01.720p.HDTV.x264-GRP',
+            'Catalan.S01E01.720p.HDTV.x264-GRP',
+            'Flemish.S01E01.720p.HDTV.x264-GRP',
+            'Series.Tagalog.S01E01.720p.HDTV.x264-GRP',
+        ]
+        for name in names:
+            self.assertEqual(analyzemod.fast_parse(name), None, msg=name)
+
+    def test_parse_uses_fast_path(self):
+        with mock.patch('guessit.guessit') as m:
+            entity, metadata, _ = analyzemod.parse(
+                'Series.Name.S01E02.1080p.WEB.h264-GROUP[eztv]')
+
+        self.assertFalse(m.called)
+        self.assertEqual(
+            (entity.series, entity.season, entity.number),
+            ('Series Name', 1, 2))
+        self.assertEqual(metadata[analyzemod.Tags.RELEASE_DISTRIBUTORS],
+                         ['eztv'])
+
+
 if __name__ == '__main__':
     unittest.main()
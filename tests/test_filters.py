@@ -4,6 +4,7 @@ import unittest
 import time
 
 from arroyo.services import Services
+from arroyo.plugins.filters import generic
 from arroyo.plugins.filters.generic import (
     SourceAttributeFilter,
     EpisodeAttributeFilter,
@@ -88,6 +89,30 @@ class TestGenericFilter(unittest.TestCase):
         self.assertTrue(f.filter('since', '2019', i))
         self.assertFalse(f.filter('since', '2021', i))
 
+    def test_compiled_matchers(self):
+        tests = [
+            (generic.cmp_like, r'Series [AB]', 'Series A S01E01'),
+            (generic.cmp_like, r'Series [AB]', 'series a S01E01'),
+            (generic.cmp_like, r'S01', 'Series A S01E01'),
+            (generic.cmp_glob, 'Series * S01E01', 'Series A S01E01'),
+            (generic.cmp_glob, 'Series ?', 'Series AB'),
+            (generic.cmp_glob, '[Ss]eries*', 'series'),
+            (generic.cmp_in, 'prov1, prov2', 'prov2'),
+            (generic.cmp_in, 'prov1, prov2', 'prov'),
+        ]
+        for (fn, filtervalue, sourcevalue) in tests:
+            cmp = generic.compile_cmp(fn, filtervalue)
+            self.assertEqual(cmp(sourcevalue), fn(filtervalue, sourcevalue),
+                             msg=(fn, filtervalue, sourcevalue))
+
+    def test_compiled_filter_is_reusable(self):
+        f = SourceAttributeFilter(Services())
+        pred = f.compile('provider-in', 'prov1, prov2')
+
+        self.assertTrue(pred(build_item('Foo', provider='prov1')))
+        self.assertTrue(pred(build_item('Foo', provider='prov2')))
+        self.assertFalse(pred(build_item('Foo', provider='prov3')))
+
 
 class TestEntityAttributeFilter(unittest.TestCase):
     def test_basic_attribute_match(self):
@@ -18,9 +18,14 @@
 # USA.
 
 
+import os
 import unittest
 
 
+from arroyo import (
+    defaults,
+    extensions
+)
 from arroyo.services import Services
 from arroyo.query import Query
 from arroyo.plugins.providers import IncompatibleQueryError
@@ -28,9 +33,13 @@ from arroyo.plugins.providers import IncompatibleQueryError
 
 from arroyo.plugins.providers.epublibre import EPubLibre
 from arroyo.plugins.providers.eztv import EzTV
+from arroyo.plugins.providers.thepiratebay import ThePirateBay
 from arroyo.plugins.providers.torrentapi import TorrentAPI
 
 
+SAMPLES_DIR = os.path.dirname(os.path.realpath(__file__)) + '/samples'
+
+
 class TestProviderMixin:
     PROVIDER_CLASS = None
     TEST_HANDLED_URLS = []
@@ -139,5 +148,48 @@ class TestTorrentAPI(TestProviderMixin, unittest.TestCase):
     ]
 
 
+@unittest.skipIf(not extensions._has_lxml, "lxml not available")
+class TestHTMLBackends(unittest.TestCase):
+    SAMPLES = [
+        (EzTV, 'eztv.html'),
+        (EzTV, 'eztv-listing.html'),
+        (ThePirateBay, 'thepiratebay-general.html'),
+        (ThePirateBay, 'thepiratebay-movies.html'),
+        (ThePirateBay, 'thepiratebay-series.html'),
+    ]
+
+    def parse(self, cls, sample, backend):
+        srvs = Services()
+        srvs.settings.set(defaults.KEY_SCRAPER_HTML_BACKEND, backend)
+
+        with open(SAMPLES_DIR + '/' + sample, encoding='utf-8') as fh:
+            items = cls(srvs).parse(fh.read())
+
+        # Timestamps are relative to current time, drop them
+        for item in items:
+            item.pop('created', None)
+            item.pop('timestamp', None)
+
+        return items
+
+    def test_backends_match(self):
+        for (cls, sample) in self.SAMPLES:
+            expected = self.parse(cls, sample, 'html.parser')
+            self.assertTrue(len(expected) > 0, msg=sample)
+
+            for backend in ('lxml', 'lxml-tree'):
+                self.assertEqual(self.parse(cls, sample, backend), expected,
+                                 msg=(sample, backend))
+
+    def test_invalid_backend(self):
+        srvs = Services()
+        srvs.settings.set(defaults.KEY_SCRAPER_HTML_BACKEND, 'lxlm')
+        self.assertEqual(EzTV(srvs).html_backend, 'html.parser')
+
+        (cls, sample) = self.SAMPLES[0]
+        self.assertEqual(self.parse(cls, sample, 'lxlm'),
+                         self.parse(cls, sample, 'html.parser'))
+
+
 if __name__ == '__main__':
     unittest.main()
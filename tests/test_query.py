@@ -18,13 +18,29 @@
 # USA.
 
 
+import time
 import unittest
 
 
+from arroyo import (
+    defaults,
+    query
+)
 from arroyo.query import (
+    CollectionIndex,
+    ColumnarIndex,
+    Engine,
+    FilterPlan,
     Query,
     InvalidQueryParameters
 )
+from arroyo.services import (
+    ClassLoader,
+    Services
+)
+
+
+from testlib import build_item
 
 
 TESTS = [
@@ -64,5 +80,286 @@ class QueryTest(unittest.TestCase):
                     msg=s)
 
 
+class FilterPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine(Services(loader=ClassLoader(defaults.PLUGINS)))
+        self.items = [
+            build_item('Foo.S01E01.720p.HDTV.x264-GRP', seeds=10),
+            build_item('Foo.S01E02.1080p.WEB.x264-GRP', seeds=5),
+            build_item('Bar.S01E01.720p.HDTV.x264-GRP', seeds=10),
+            build_item('Some.Movie.2019.720p.BluRay.x264-GRP', seeds=20),
+        ]
+
+    def test_filter_dispatch_table(self):
+        f1 = self.engine.get_filter('series')
+        self.assertTrue(self.engine.get_filter('series') is f1)
+        self.assertTrue(self.engine.get_filter('series-glob') is f1)
+
+        # Table is rebuilt if the loader changes
+        loader = self.engine.srvs.loader
+        loader.register('filters.episode',
+                        loader.get_class('filters.episode'))
+        self.assertFalse(self.engine.get_filter('series') is f1)
+
+    def test_plan_is_iterable_as_triples(self):
+        plan = self.engine.build_filter_context(
+            Query(series='foo', quality='720p'))
+
+        self.assertTrue(isinstance(plan, FilterPlan))
+        self.assertEqual(
+            sorted((key, value) for (_, key, value) in plan),
+            [('quality', '720p'), ('series', 'foo'), ('state', 'none')])
+
+    def test_apply(self):
+        plan = self.engine.build_filter_context(
+            Query(series='foo', quality='720p'))
+        ret = self.engine.apply(plan, self.items)
+
+        self.assertEqual(ret, [self.items[0]])
+
+        plan = self.engine.build_filter_context(
+            Query(seeds_min='10', type='episode'))
+        ret = self.engine.apply(plan, self.items)
+
+        self.assertEqual(ret, [self.items[0], self.items[2]])
+
+    def test_apply_accepts_triples(self):
+        plan = self.engine.build_filter_context(Query(series='foo'))
+        ret = self.engine.apply(list(plan), self.items)
+
+        self.assertEqual(ret, self.items[:2])
+
+    def test_single_pass_short_circuits(self):
+        plan = self.engine.build_filter_context(
+            Query(series='bar', quality='720p'))
+
+        calls = []
+        preds = plan.predicates
+        plan.predicates = [
+            (lambda i, p=p: calls.append(i) or p(i)) for p in preds]
+
+        ret = plan.apply(self.items)
+        self.assertEqual(ret, [self.items[2]])
+        # First predicate sees every item, the rest only survivors
+        self.assertTrue(len(calls) < len(self.items) * len(preds))
+
+    def test_cheap_filters_first(self):
+        plan = self.engine.build_filter_context(
+            Query(name_like='Foo.*', state='none', quality='720p',
+                  type='episode'))
+        plan.optimize()
+
+        # quality and state have the same cost
+        order = [plan.filters[idx][1] for idx in plan.order]
+        self.assertEqual(order[0], 'type')
+        self.assertEqual(sorted(order[1:3]), ['quality', 'state'])
+        self.assertEqual(order[3], 'name-like')
+
+    def test_selective_filters_first(self):
+        # Both filters have the same cost but quality rejects more items
+        items = self.items * 10
+        plan = self.engine.build_filter_context(
+            Query(type='episode', quality='1080p', state='all'))
+
+        self.engine.apply(plan, items)
+        self.engine.apply(plan, items)
+
+        self.assertEqual(
+            [plan.filters[idx][1] for idx in plan.order][:2],
+            ['quality', 'type'])
+
+        # Statistics are shared with new plans from the same engine
+        plan2 = self.engine.build_filter_context(
+            Query(type='episode', quality='1080p', state='all'))
+        plan2.optimize()
+        self.assertEqual(plan2.order, plan.order)
+
+    def test_stats_are_kept_per_value(self):
+        def quality_selectivity(plan):
+            idx = [key for (_, key, _) in plan].index('quality')
+            return plan.selectivity(idx)
+
+        items = self.items * 10
+        plan = self.engine.build_filter_context(
+            Query(quality='1080p', state='all'))
+        self.engine.apply(plan, items)
+        self.assertEqual(quality_selectivity(plan), 0.25)
+
+        # quality=720p doesn't reject the same items
+        plan2 = self.engine.build_filter_context(
+            Query(quality='720p', state='all'))
+        self.assertEqual(quality_selectivity(plan2),
+                         FilterPlan.DEFAULT_SELECTIVITY)
+
+    def test_explain(self):
+        plan = self.engine.build_filter_context(
+            Query(series='foo', quality='720p'))
+        self.engine.apply(plan, self.items)
+
+        rows = {row['filter']: row for row in plan.explain()}
+        self.assertEqual(
+            (rows['series']['seen'], rows['series']['passed']),
+            (4, 2))
+        self.assertEqual(
+            (rows['quality']['seen'], rows['quality']['passed']),
+            (2, 1))
+        self.assertTrue('series' in self.engine.explain(plan))
+
+    def test_index_lookups(self):
+        index = self.engine.build_index(self.items)
+        tests = [
+            (Query(series='FOO'), [0, 1]),
+            (Query(type='movie'), [3]),
+            (Query(type_in='episode, movie'), [0, 1, 2, 3]),
+            (Query(season=1, number=1), [0, 2]),
+            (Query(seeds_min='10'), [0, 2, 3]),
+            (Query(seeds_max=10, seeds_min=6), [0, 2]),
+            (Query(title='some movie', movie_year_min=2019), [3]),
+            (Query(series='baz'), []),
+        ]
+
+        for (q, expected) in tests:
+            plan = self.engine.build_filter_context(q)
+            self.assertEqual(plan.candidates(index), expected)
+
+    def test_apply_with_index(self):
+        index = self.engine.build_index(self.items)
+        queries = [
+            Query(series='foo', quality='720p'),
+            Query(seeds_min='10', type='episode'),
+            Query(name_like='.*720p.*', state='all'),
+            Query(provider='mock', seeds_max=10),
+        ]
+
+        for q in queries:
+            plan = self.engine.build_filter_context(q)
+            self.assertEqual(
+                self.engine.apply(plan, self.items, index=index),
+                self.engine.apply(plan, self.items))
+
+    def test_index_narrows_candidates(self):
+        index = self.engine.build_index(self.items)
+        plan = self.engine.build_filter_context(
+            Query(series='bar', quality='720p'))
+        plan.apply(self.items, index=index)
+
+        rows = {row['filter']: row for row in plan.explain()}
+        self.assertTrue(rows['series']['indexed'])
+        self.assertFalse(rows['quality']['indexed'])
+        # Exact lookups are not applied again over candidates
+        self.assertEqual(rows['series']['seen'], 0)
+        self.assertEqual(rows['quality']['seen'], 1)
+
+    def test_index_skips_missing_values(self):
+        items = self.items + [build_item('no entity here', seeds=None)]
+        index = CollectionIndex(items)
+        plan = self.engine.build_filter_context(
+            Query(seeds_max=100, type_in='episode'))
+
+        self.assertEqual(plan.candidates(index), [0, 1, 2])
+
+    def test_index_age_and_since(self):
+        now = int(time.time())
+        items = [
+            build_item('Foo.S01E01.720p', created=now - 3600),
+            build_item('Foo.S01E02.720p', created=now - 86400 * 10),
+            build_item('Foo.S01E03.720p'),
+        ]
+        index = self.engine.build_index(items)
+        queries = [
+            Query(age_max=86400, state='all'),
+            Query(age_min=86400, state='all'),
+            Query(since='2000-01-01', state='all'),
+        ]
+
+        for q in queries:
+            plan = self.engine.build_filter_context(q)
+            self.assertEqual(
+                [key for ((_, key, _), lookup) in zip(plan, plan.lookups)
+                 if lookup],
+                [key.replace('_', '-') for key in q if key != 'state'])
+            self.assertEqual(
+                self.engine.apply(plan, items, index=index),
+                self.engine.apply(plan, items))
+
+
+class IndexMixin:
+    """
+    Same results with and without index for any CollectionIndex subclass
+    """
+    INDEX_CLASS = None
+
+    def setUp(self):
+        self.engine = Engine(Services(loader=ClassLoader(defaults.PLUGINS)))
+        self.items = [
+            build_item('Foo.S01E01.720p.HDTV.x264-GRP', seeds=10, size=700),
+            build_item('Foo.S01E02.1080p.WEB.x264-GRP', seeds=5, size=1500),
+            build_item('Bar.S02E01.720p.HDTV.x264-GRP', seeds=0, size=300),
+            build_item('Some.Movie.2019.720p.BluRay.x264-GRP', seeds=20,
+                       size=4000),
+            build_item('Other.Movie.2001.1080p.BluRay', seeds=1, size=8000),
+        ]
+        self.index = self.INDEX_CLASS(self.items)
+
+    def test_results(self):
+        queries = [
+            Query(seeds=10, state='all'),
+            Query(seeds_min=5, size_max=2000, state='all'),
+            Query(size_min='1500', type='episode', state='all'),
+            Query(season=2, number_max=1, state='all'),
+            Query(movie_year_max=2010, seeds_max=100, state='all'),
+            Query(series='foo', size_max=1000, quality='720p', state='all'),
+            Query(provider_in='mock, other', seeds_min=1, state='all'),
+        ]
+
+        for q in queries:
+            plan = self.engine.build_filter_context(q)
+            self.assertEqual(
+                self.engine.apply(plan, self.items, index=self.index),
+                self.engine.apply(plan, self.items),
+                msg=repr(q))
+
+
+class CollectionIndexTest(IndexMixin, unittest.TestCase):
+    INDEX_CLASS = CollectionIndex
+
+
+@unittest.skipIf(not query._has_numpy, "numpy not available")
+class ColumnarIndexTest(IndexMixin, unittest.TestCase):
+    INDEX_CLASS = ColumnarIndex
+
+    def test_columns(self):
+        plan = self.engine.build_filter_context(
+            Query(seeds_min=5, series='foo', state='all'))
+
+        self.assertEqual(plan.candidates(self.index), [0, 1])
+        self.assertEqual(
+            sorted(k for (k, v) in self.index.columns.items() if v),
+            ['seeds'])
+
+    def test_missing_values_are_masked(self):
+        items = self.items + [build_item('Foo.S01E04.720p')]
+        index = ColumnarIndex(items)
+        plan = self.engine.build_filter_context(
+            Query(seeds_max=100, state='all'))
+
+        self.assertEqual(plan.candidates(index), [0, 1, 2, 3, 4])
+
+        values, valid = index.columns['seeds']
+        self.assertEqual(valid.tolist(), [True] * 5 + [False])
+
+    def test_non_numeric_fields_use_regular_indexes(self):
+        plan = self.engine.build_filter_context(
+            Query(provider='MOCK', state='all'))
+
+        self.assertEqual(plan.candidates(self.index), [0, 1, 2, 3, 4])
+        self.assertEqual(self.index.columns, {})
+
+    def test_build_index(self):
+        self.assertTrue(isinstance(
+            self.engine.build_index(self.items, columnar=True),
+            ColumnarIndex))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import pickle
+import unittest
+
+
+from arroyo import schema
+
+
+from testlib import build_item
+
+
+class TestSource(unittest.TestCase):
+    def test_from_trusted(self):
+        src = build_item('Series.Name.S01E02.720p.HDTV.x264-GRP',
+                         seeds=10)
+        data = src.dict()
+
+        trusted = schema.Source.from_trusted(data)
+        self.assertEqual(trusted, src)
+        self.assertEqual(trusted.id, src.id)
+        self.assertTrue(isinstance(trusted.entity, schema.Episode))
+        self.assertEqual(trusted.entity, src.entity)
+
+        # Nested data is not shared with the input
+        trusted.metadata['foo'] = 'bar'
+        self.assertFalse('foo' in data['metadata'])
+
+    def test_from_trusted_defaults(self):
+        src = schema.Source.from_trusted({
+            'name': 'foo',
+            'provider': 'mock',
+            'uri': 'magnet:?xt=urn:btih:1234'
+        })
+
+        self.assertEqual(src.id, '1234')
+        self.assertEqual(src.seeds, None)
+        self.assertEqual(src.hints, {})
+        self.assertEqual(src.entity, None)
+
+
+class TestEntity(unittest.TestCase):
+    def test_identity_is_case_insensitive(self):
+        a = schema.Episode(type='episode', series='Dark', season=1, number=2)
+        b = schema.Episode(type='episode', series='DARK', season=1, number=2)
+
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(a.id, b.id)
+        self.assertNotEqual(a, schema.Movie(type='movie', title='Dark'))
+
+    def test_identity_is_cached(self):
+        a = schema.Movie(type='movie', title='Foo', year=2000)
+        self.assertTrue(a.id is a.id)
+        self.assertTrue(a.key is a.key)
+
+    def test_immutable(self):
+        a = schema.Movie(type='movie', title='Foo', year=2000)
+        with self.assertRaises(TypeError):
+            a.title = 'Bar'
+
+    def test_pickle(self):
+        a = schema.Movie(type='movie', title='Foo', year=2000)
+        a.id
+        # Pretend the hash was computed in another process
+        a._hash = hash(a) + 1
+        b = pickle.loads(pickle.dumps(a))
+
+        self.assertEqual(a, b)
+        self.assertEqual(a.id, b.id)
+
+        c = schema.Movie(type='movie', title='Foo', year=2000)
+        self.assertEqual(hash(b), hash(c))
+        self.assertTrue(b in {c})
+
+
+if __name__ == '__main__':
+    unittest.main()
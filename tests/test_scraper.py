@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import asyncio
+import hashlib
+import json
+import time
+import unittest
+from unittest import mock
+
+
+import aiohttp
+
+
+from arroyo import (
+    application,
+    defaults,
+    extensions,
+    scraper
+)
+from arroyo.services import (
+    Services,
+    cache,
+    storage
+)
+
+
+class MockProvider(extensions.Provider):
+    DEFAULT_URI = 'http://mock.example/page/0'
+    URI_GLOBS = ['http://mock.example/*']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sessions = []
+
+    async def fetch(self, sess, uri, headers=None):
+        self.sessions.append(sess)
+
+        sha1 = hashlib.sha1()
+        sha1.update(uri.encode('utf-8'))
+        name = 'Series A S01E0%s' % uri[-1]
+        return json.dumps([{
+            'name': name,
+            'uri': 'magnet:?dn=%s&xt=urn:btih:%s' % (name, sha1.hexdigest())
+        }])
+
+    def paginate(self, uri):
+        for page in range(0, 10):
+            yield 'http://mock.example/page/%s' % page
+
+    def parse(self, buffer):
+        return json.loads(buffer)
+
+
+class LimitedProvider(MockProvider):
+    RATE_LIMIT = 20
+    RATE_BURST = 2
+    MAX_IN_FLIGHT = 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fetch(self, sess, uri, headers=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        return await super().fetch(sess, uri)
+
+
+class SlowProvider(MockProvider):
+    DELAY = 0.3
+    STEPS = 30
+
+    async def fetch(self, sess, uri, headers=None):
+        # Like reading a response in chunks, needs the loop to be running
+        if not uri.endswith('/0'):
+            for _ in range(self.STEPS):
+                await asyncio.sleep(self.DELAY / self.STEPS)
+
+        return await super().fetch(sess, uri)
+
+
+class TokenProvider(MockProvider):
+    RATE_LIMIT = 10
+    MAX_IN_FLIGHT = 2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token = None
+        self.requests = []
+
+    async def prepare_fetch(self, sess, uri, throttle):
+        if self.token is None:
+            await throttle()
+            self.requests.append(('token', time.monotonic()))
+            self.token = 'x'
+
+    async def fetch(self, sess, uri, headers=None):
+        self.requests.append((uri, time.monotonic()))
+        return await super().fetch(sess, uri)
+
+
+class ConditionalProvider(MockProvider):
+    ETAG = '"v1"'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+
+    async def fetch(self, sess, uri, headers=None):
+        self.requests.append(headers)
+
+        if headers and headers.get('If-None-Match') == self.ETAG:
+            return extensions.Response(status=304, headers={}, text='')
+
+        text = await super().fetch(sess, uri)
+        return extensions.Response(status=200, headers={'ETag': self.ETAG},
+                                   text=text)
+
+
+class FlakyProvider(MockProvider):
+    def __init__(self, *args, failures=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+        self.attempts = 0
+
+    async def fetch(self, sess, uri, headers=None):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise aiohttp.ClientConnectionError()
+
+        return await super().fetch(sess, uri, headers=headers)
+
+
+class BrokenProvider(MockProvider):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.broken = True
+
+    async def fetch(self, sess, uri, headers=None):
+        if self.broken:
+            b'\xff'.decode('utf-8')
+
+        return await super().fetch(sess, uri, headers=headers)
+
+
+def build_services():
+    # Use application settings, they fallback to defaults
+    srvs = Services(settings=application.Settings(storage.MemoryStorage()))
+    srvs.settings.set(defaults.KEY_SCRAPER_RETRY_BACKOFF, 0.001)
+    return srvs
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        self.srvs = build_services()
+        self.provider = MockProvider(self.srvs)
+        self.engine = scraper.Engine(self.srvs)
+
+    def test_process(self):
+        ctxs = self.engine.build_n_contexts(3, provider=self.provider)
+        results = self.engine.process(*ctxs)
+
+        self.assertEqual(
+            sorted([x.name for x in results]),
+            ['Series A S01E00', 'Series A S01E01', 'Series A S01E02'])
+        self.assertFalse(self.engine.is_open)
+
+    def test_process_incremental(self):
+        results = self.engine.process_incremental(3, provider=self.provider)
+        self.assertEqual(len(results), 3)
+
+        # Page 0 has only seen sources, stop there
+        results = self.engine.process_incremental(3, provider=self.provider)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(self.provider.sessions), 4)
+
+        # Asking for more pages doesn't go past the first seen page
+        results = self.engine.process_incremental(5, provider=self.provider)
+        self.assertEqual(len(results), 1)
+
+    def test_process_incremental_skips_failed_pages(self):
+        self.engine.process_incremental(1, provider=self.provider)
+
+        # Page 0 fails now, it's not considered as a seen page
+        self.srvs.settings.set(defaults.KEY_SCRAPER_RETRIES, 0)
+        fetch = self.provider.fetch
+
+        async def _fetch(sess, uri, headers=None):
+            if uri.endswith('/0'):
+                raise aiohttp.ClientConnectionError()
+
+            return await fetch(sess, uri, headers=headers)
+
+        self.provider.fetch = _fetch
+        results = self.engine.process_incremental(3, provider=self.provider)
+        self.assertEqual(
+            sorted([x.name for x in results]),
+            ['Series A S01E01', 'Series A S01E02'])
+
+    def test_process_iter(self):
+        ctxs = self.engine.build_n_contexts(3, provider=self.provider)
+        batches = list(self.engine.process_iter(*ctxs))
+
+        self.assertEqual(len(batches), 3)
+        self.assertTrue(all(len(x) == 1 for x in batches))
+
+    def test_process_iter_early_stop(self):
+        ctxs = self.engine.build_n_contexts(5, provider=self.provider)
+
+        with self.engine:
+            g = self.engine.process_iter(*ctxs)
+            next(g)
+            g.close()
+
+            self.assertTrue(self.engine.is_open)
+            self.assertEqual(len(self.engine.process(*ctxs)), 5)
+
+    def test_process_iter_fetches_while_consumer_works(self):
+        provider = SlowProvider(self.srvs)
+        ctxs = self.engine.build_n_contexts(2, provider=provider)
+
+        t0 = time.monotonic()
+        for batch in self.engine.process_iter(*ctxs):
+            # Slow consumer, the second request should not wait for it
+            time.sleep(provider.DELAY)
+
+        elapsed = time.monotonic() - t0
+        self.assertTrue(elapsed < provider.DELAY * 2.5, elapsed)
+
+    def test_parse_workers(self):
+        self.srvs.settings.set(defaults.KEY_SCRAPER_PARSE_WORKERS, 2)
+        ctxs = self.engine.build_n_contexts(3, provider=self.provider)
+
+        results = self.engine.process(*ctxs)
+        self.assertEqual(
+            sorted([x.name for x in results]),
+            ['Series A S01E00', 'Series A S01E01', 'Series A S01E02'])
+
+        buffers = self.engine.fetch(*ctxs)
+        self.assertEqual(
+            sorted([x.name for x in self.engine.parse(*buffers)]),
+            sorted([x.name for x in results]))
+        self.assertTrue(self.engine._executor is None)
+
+    def test_single_flight(self):
+        provider = LimitedProvider(self.srvs)
+        ctxs = [self.engine.build_context(provider=provider)
+                for _ in range(3)]
+
+        results = self.engine.fetch(*ctxs)
+
+        self.assertEqual(len(provider.sessions), 1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(set(content for (_, content) in results)), 1)
+        self.assertEqual(set(ctx for (ctx, _) in results), set(ctxs))
+
+    def test_conditional_request(self):
+        self.srvs.cache = cache.MemoryCache(delta=10)
+        provider = ConditionalProvider(self.srvs)
+        ctx = self.engine.build_context(provider=provider)
+
+        body = self.engine.fetch_one(ctx)
+        self.assertEqual(provider.requests, [None])
+
+        # Fresh entry, no request
+        self.assertEqual(self.engine.fetch_one(ctx), body)
+        self.assertEqual(len(provider.requests), 1)
+
+        # Expired entry, revalidate
+        with mock.patch('arroyo.services.cache._now',
+                        return_value=cache._now() + 20):
+            self.assertEqual(self.engine.fetch_one(ctx), body)
+            self.assertEqual(provider.requests[-1],
+                             {'If-None-Match': provider.ETAG})
+
+            # Revalidated entry is fresh again
+            self.assertEqual(self.engine.fetch_one(ctx), body)
+            self.assertEqual(len(provider.requests), 2)
+
+    def test_session_is_shared_while_open(self):
+        ctx1, ctx2 = self.engine.build_n_contexts(2, provider=self.provider)
+
+        with self.engine:
+            self.engine.fetch(ctx1)
+            self.engine.fetch(ctx2)
+            self.assertTrue(self.engine.is_open)
+
+        self.assertFalse(self.engine.is_open)
+        self.assertEqual(len(self.provider.sessions), 2)
+        self.assertTrue(
+            self.provider.sessions[0] is self.provider.sessions[1])
+        self.assertTrue(self.provider.sessions[0].closed)
+
+    def test_session_per_call_when_closed(self):
+        ctx1, ctx2 = self.engine.build_n_contexts(2, provider=self.provider)
+
+        self.engine.fetch(ctx1)
+        self.engine.fetch(ctx2)
+
+        self.assertFalse(
+            self.provider.sessions[0] is self.provider.sessions[1])
+
+
+class TestHostScheduler(unittest.TestCase):
+    def test_token_bucket(self):
+        async def _run():
+            bucket = scraper.TokenBucket(rate=20, burst=2)
+            t0 = time.monotonic()
+            for _ in range(4):
+                await bucket.acquire()
+
+            return time.monotonic() - t0
+
+        # Two requests from burst, two more at 20 req/s
+        elapsed = asyncio.run(_run())
+        self.assertTrue(0.09 <= elapsed < 0.5, msg=elapsed)
+
+    def test_max_in_flight_per_host(self):
+        srvs = build_services()
+        provider = LimitedProvider(srvs)
+        engine = scraper.Engine(srvs)
+
+        ctxs = engine.build_n_contexts(4, provider=provider)
+        engine.fetch(*ctxs)
+
+        self.assertEqual(provider.max_in_flight, 1)
+
+    def test_prepare_fetch_is_rate_limited(self):
+        srvs = build_services()
+        provider = TokenProvider(srvs)
+        engine = scraper.Engine(srvs)
+
+        ctxs = engine.build_n_contexts(3, provider=provider)
+        engine.fetch(*ctxs)
+
+        self.assertEqual(len(provider.requests), 4)
+        self.assertEqual(provider.requests[0][0], 'token')
+
+        # Every request, including the token one, waits for the bucket
+        ts = [t for (_, t) in provider.requests]
+        delta = 1 / provider.RATE_LIMIT
+        for (t1, t2) in zip(ts, ts[1:]):
+            self.assertTrue(t2 - t1 >= delta * 0.9, msg=t2 - t1)
+
+    def test_host(self):
+        self.assertEqual(
+            scraper.HostScheduler.host('https://Foo.Example:8080/x?y=1'),
+            'foo.example:8080')
+
+
+class TestRetries(unittest.TestCase):
+    def setUp(self):
+        self.srvs = build_services()
+        self.engine = scraper.Engine(self.srvs)
+
+    def test_retry(self):
+        provider = FlakyProvider(self.srvs, failures=2)
+        ctx = self.engine.build_context(provider=provider)
+
+        self.assertTrue(self.engine.fetch_one(ctx))
+        self.assertEqual(provider.attempts, 3)
+
+    def test_give_up(self):
+        self.srvs.settings.set(defaults.KEY_SCRAPER_RETRIES, 1)
+        provider = FlakyProvider(self.srvs, failures=10)
+        ctx = self.engine.build_context(provider=provider)
+
+        self.assertEqual(self.engine.fetch_one(ctx), '')
+        self.assertEqual(provider.attempts, 2)
+
+    def test_circuit_breaker(self):
+        self.srvs.settings.set(defaults.KEY_SCRAPER_RETRIES, 0)
+        self.srvs.settings.set(defaults.KEY_SCRAPER_BREAKER_THRESHOLD, 2)
+        self.srvs.settings.set(defaults.KEY_SCRAPER_MAX_PARALEL_REQUESTS, 1)
+        provider = FlakyProvider(self.srvs, failures=10)
+
+        ctxs = self.engine.build_n_contexts(5, provider=provider)
+        results = self.engine.fetch(*ctxs)
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(provider.attempts, 2)
+        self.assertTrue(self.engine.breaker('flakyprovider').is_open)
+
+    def test_circuit_breaker_half_open(self):
+        breaker = scraper.CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record(error=True)
+        self.assertEqual(breaker.state, 'half-open')
+
+        # Only one probe, the rest fail fast until it finishes
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(error=True, probe=True)
+
+        self.assertTrue(breaker.allow())
+        breaker.record(error=False, probe=True)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_circuit_breaker_sends_one_probe(self):
+        self.srvs.settings.set(defaults.KEY_SCRAPER_RETRIES, 0)
+        self.srvs.settings.set(defaults.KEY_SCRAPER_BREAKER_THRESHOLD, 1)
+        self.srvs.settings.set(defaults.KEY_SCRAPER_BREAKER_COOLDOWN, 0)
+        # Requests take some time, all of them reach the breaker while the
+        # probe is in flight
+        provider = LimitedProvider(self.srvs)
+        self.engine.breaker('limitedprovider').record(error=True)
+
+        ctxs = self.engine.build_n_contexts(5, provider=provider)
+        results = self.engine.fetch(*ctxs)
+
+        self.assertEqual(len([x for (_, x) in results if x]), 1)
+        self.assertEqual(len(provider.sessions), 1)
+        self.assertEqual(self.engine.breaker('limitedprovider').state,
+                         'closed')
+
+    def test_circuit_breaker_probe_raises(self):
+        self.srvs.settings.set(defaults.KEY_SCRAPER_BREAKER_THRESHOLD, 1)
+        self.srvs.settings.set(defaults.KEY_SCRAPER_BREAKER_COOLDOWN, 0)
+        provider = BrokenProvider(self.srvs)
+        breaker = self.engine.breaker('brokenprovider')
+        breaker.record(error=True)
+
+        ctx = self.engine.build_context(provider=provider)
+        with self.assertRaises(UnicodeDecodeError):
+            self.engine.fetch(ctx)
+
+        # The failed probe doesn't block the provider once it recovers
+        self.assertFalse(breaker.probing)
+        provider.broken = False
+        ((_, content),) = self.engine.fetch(ctx)
+        self.assertTrue(content)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_circuit_breaker_cooldown(self):
+        breaker = scraper.CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record(error=True)
+        self.assertFalse(breaker.is_open)
+
+        breaker.cooldown = 60
+        breaker.record(error=True)
+        self.assertTrue(breaker.is_open)
+
+        breaker.record(error=False)
+        self.assertFalse(breaker.is_open)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_additive_increase(self):
+        limiter = scraper.AdaptiveLimiter(initial=2, maximum=4)
+        for _ in range(2):
+            limiter.record(latency=0.1)
+        self.assertEqual(limiter.limit, 3)
+
+        for _ in range(10):
+            limiter.record(latency=0.1)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_hold_on_latency_increase(self):
+        limiter = scraper.AdaptiveLimiter(initial=2, maximum=4)
+        limiter.record(latency=0.1)
+        for _ in range(5):
+            limiter.record(latency=1)
+
+        self.assertEqual(limiter.limit, 2)
+
+    def test_multiplicative_decrease(self):
+        limiter = scraper.AdaptiveLimiter(initial=8, maximum=10)
+        limiter.record(error=True)
+        self.assertEqual(limiter.limit, 4)
+
+        for _ in range(5):
+            limiter.record(error=True)
+        self.assertEqual(limiter.limit, 1)
+
+    def test_percentiles(self):
+        limiter = scraper.AdaptiveLimiter()
+        for x in range(1, 101):
+            limiter.record(latency=x)
+
+        self.assertEqual(limiter.percentiles(50, 90), {50: 51, 90: 91})
+        self.assertEqual(limiter.stats()['limit'], limiter.limit)
+
+    def test_slot(self):
+        async def _task(limiter, acc):
+            async with limiter.slot():
+                acc.append(limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def _run(limiter):
+            acc = []
+            await asyncio.gather(*[_task(limiter, acc) for _ in range(6)])
+            return acc
+
+        limiter = scraper.AdaptiveLimiter(initial=2)
+        self.assertEqual(max(asyncio.run(_run(limiter))), 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_engine_tracks_providers(self):
+        srvs = build_services()
+        engine = scraper.Engine(srvs)
+        ctxs = engine.build_n_contexts(3, provider=MockProvider(srvs))
+        engine.fetch(*ctxs)
+
+        self.assertEqual(list(engine.limiters), ['mockprovider'])
+        self.assertEqual(len(engine.limiter('mockprovider').latencies), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
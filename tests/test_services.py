@@ -18,10 +18,19 @@
 # USA.
 
 
+import gc
 import unittest
+import weakref
+from unittest import mock
 
 
 from arroyo.services import ClassLoader
+from arroyo.services import cache
+from arroyo.services import database
+from arroyo.services import storage
+
+
+from testlib import build_item
 
 
 class Foo:
@@ -50,6 +59,136 @@ class TestClassLoader(unittest.TestCase):
         self.assertTrue(foo.args == (1, 2))
         self.assertTrue(foo.kwargs == dict(a=3))
 
+    def test_get_instance(self):
+        cl = ClassLoader()
+        cl.register('foo', Foo)
+        scope1, scope2 = Foo(), Foo()
+
+        foo = cl.get_instance('foo', scope1)
+        self.assertTrue(isinstance(foo, Foo))
+        self.assertTrue(foo.args == (scope1,))
+        self.assertTrue(cl.get_instance('foo', scope1) is foo)
+        self.assertFalse(cl.get_instance('foo', scope2) is foo)
+
+    def test_get_instance_invalidation(self):
+        cl = ClassLoader()
+        cl.register('foo', Foo)
+        scope = Foo()
+
+        foo = cl.get_instance('foo', scope)
+        cl.invalidate('foo', scope)
+        foo2 = cl.get_instance('foo', scope)
+        self.assertFalse(foo2 is foo)
+
+        # Registering a name drops its instances
+        cl.register('foo', Foo)
+        self.assertFalse(cl.get_instance('foo', scope) is foo2)
+
+    def test_get_instance_doesnt_keep_scope_alive(self):
+        cl = ClassLoader({'foo': Foo})
+        scope = Foo()
+        cl.get_instance('foo', scope)
+
+        ref = weakref.ref(scope)
+        del scope
+        gc.collect()
+        self.assertTrue(ref() is None)
+
+
+class CacheTestMixin:
+    def build_cache(self, delta):
+        raise NotImplementedError()
+
+    def test_expired(self):
+        c = self.build_cache(delta=10)
+        c.set('foo', 'bar')
+
+        with mock.patch('arroyo.services.cache._now',
+                        return_value=cache._now() + 20):
+            with self.assertRaises(cache.CacheKeyExpiredError):
+                c.get('foo')
+
+            self.assertEqual(c.get('foo', stale=True), 'bar')
+
+    def test_touch(self):
+        c = self.build_cache(delta=10)
+        c.set('foo', 'bar')
+
+        with mock.patch('arroyo.services.cache._now',
+                        return_value=cache._now() + 20):
+            c.touch('foo')
+            self.assertEqual(c.get('foo'), 'bar')
+
+    def test_touch_missing(self):
+        c = self.build_cache(delta=10)
+        with self.assertRaises(cache.CacheKeyMissError):
+            c.touch('foo')
+
+    def test_get_many(self):
+        c = self.build_cache(delta=10)
+        c.set('foo', 1)
+        c.set('bar', 2)
+
+        self.assertEqual(c.get_many(['foo', 'bar', 'baz']),
+                         {'foo': 1, 'bar': 2})
+
+
+class TestMemoryCache(CacheTestMixin, unittest.TestCase):
+    def build_cache(self, delta):
+        return cache.MemoryCache(delta=delta)
+
+
+class TestDiskCache(CacheTestMixin, unittest.TestCase):
+    def build_cache(self, delta):
+        return cache.DiskCache(delta=delta)
+
+    def test_corrupted_entry(self):
+        c = self.build_cache(delta=10)
+        c.set('foo', list(range(100)))
+
+        p = c.encode_key('foo')
+        p.write_bytes(p.read_bytes()[:10])
+        with self.assertRaises(cache.CacheKeyError):
+            c.get('foo')
+
+        self.assertFalse(p.exists())
+
+
+class TestDownloadsDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db = database.Database(storage.MemoryStorage())
+
+    def test_has_entity(self):
+        s1 = build_item('Foo.S01E01.720p.HDTV.x264-GRP')
+        s2 = build_item('Foo.S01E01.1080p.WEB.x264-GRP')
+        s3 = build_item('Foo.S01E02.720p.HDTV.x264-GRP')
+
+        self.assertFalse(self.db.downloads.has_entity(s1.entity))
+
+        self.db.downloads.add(s1, 'ext1', entity=s1.entity)
+        self.assertTrue(self.db.downloads.has_entity(s1.entity))
+        self.assertTrue(self.db.downloads.has_entity(s2.entity))
+        self.assertFalse(self.db.downloads.has_entity(s3.entity))
+
+        self.db.downloads.delete(s1)
+        self.assertFalse(self.db.downloads.has_entity(s1.entity))
+
+    def test_has_entity_matches_sources_for_entity(self):
+        srcs = [build_item(x) for x in [
+            'Foo.S01E01.720p.HDTV.x264-GRP',
+            'FOO.S01E01.720p.HDTV.x264-GRP',
+            'Foo.2019.S01E01.720p.HDTV.x264-GRP',
+            'Some.Movie.2019.720p.BluRay.x264-GRP',
+        ]]
+        self.db.downloads.add(srcs[0], 'ext1', entity=srcs[0].entity)
+        self.db.downloads.add(srcs[3], 'ext2', entity=srcs[3].entity)
+
+        for src in srcs:
+            self.assertEqual(
+                self.db.downloads.has_entity(src.entity),
+                bool(self.db.downloads.sources_for_entity(src.entity)),
+                msg=src.name)
+
 
 if __name__ == '__main__':
     unittest.main()